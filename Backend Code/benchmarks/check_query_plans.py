@@ -0,0 +1,135 @@
+# benchmarks/check_query_plans.py
+"""
+Query plan regression check: EXPLAINs the main task, membership and calendar queries,
+built with the same helpers the routers use, and fails if any of them reads a large
+table with a sequential scan.
+
+    python seed.py --bulk --users 20000 --tasks 1000000
+    python benchmarks/check_query_plans.py
+
+Exits with status 1 on a regression. Works on PostgreSQL (EXPLAIN, after ANALYZE) and
+SQLite (EXPLAIN QUERY PLAN). Tables with fewer than --min-rows rows are reported but
+not failed, since scanning a small table is often the right plan.
+"""
+import argparse
+import os
+import re
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+
+# Add the backend root to the sys.path to allow imports like 'database' and 'models'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func, select, text
+
+from database import engine
+from models import Event, Task, User, group_members
+from routers.calendar import birthday_window_filter
+from routers.tasks import TASK_COLUMNS, visible_to
+from utils.principal_cache import Principal
+
+CHECKED_TABLES = ("tasks", "group_members", "users", "events")
+PAGE = 101
+
+_POSTGRES_SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+# SQLite reports a full table (or full index) scan as "SCAN <table>"; lookups are "SEARCH"
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)")
+
+
+def sample_parameters(connection) -> dict:
+    """
+    Picks real ids from the seeded data: a regular user with groups, a group and a company.
+    """
+    member = connection.execute(
+        select(group_members.c.user_id)
+        .join(User, User.id == group_members.c.user_id)
+        .where(User.role != "admin")
+        .limit(1)
+    ).scalar()
+    if member is None:
+        sys.exit("No group memberships found; seed the database first (python seed.py --bulk).")
+    group_ids = frozenset(connection.scalars(select(group_members.c.group_id).where(group_members.c.user_id == member)))
+    company_id = connection.scalar(select(Task.company_id).where(Task.company_id.isnot(None)).limit(1))
+    return {
+        "user": Principal(id=member, email="", role="user", is_active=True, group_ids=group_ids),
+        "group_id": min(group_ids),
+        "company_id": company_id or 0,
+    }
+
+
+def build_queries(parameters: dict) -> dict:
+    user = parameters["user"]
+    # A month view, like the frontend calendar
+    start = date.today()
+    end = start + timedelta(days=30)
+    window_start, window_end = datetime.combine(start, time.min), datetime.combine(end + timedelta(days=1), time.min)
+    in_window = (Task.deadline >= window_start, Task.deadline < window_end)
+
+    return {
+        "GET /tasks/ (user)": select(*TASK_COLUMNS).where(visible_to(user, Task.owner_id, Task.group_id))
+        .order_by(Task.id).limit(PAGE),
+        "GET /groups/{id}/tasks": select(*TASK_COLUMNS).where(Task.group_id == parameters["group_id"])
+        .order_by(Task.id).limit(PAGE),
+        "GET /groups/{id}/members": select(User.id, User.email)
+        .join(group_members, group_members.c.user_id == User.id)
+        .where(group_members.c.group_id == parameters["group_id"]),
+        "groups of a user (login)": select(group_members.c.group_id).where(group_members.c.user_id == user.id),
+        "DELETE /companies/{id} (unlink tasks)": select(Task.id).where(Task.company_id == parameters["company_id"]),
+        "calendar tasks (admin)": select(Task.title, Task.deadline, Task.deadline_all_day).where(*in_window),
+        "calendar tasks (user)": select(Task.title, Task.deadline, Task.deadline_all_day)
+        .where(*in_window, visible_to(user, Task.owner_id, Task.group_id)),
+        "calendar birthdays": select(User.first_name, User.email, User.birthday).where(birthday_window_filter(start, end)),
+        "calendar events": select(Event.title, Event.event_date)
+        .where(Event.event_date >= window_start, Event.event_date < window_end),
+        "GET /tasks/changes (admin)": select(*TASK_COLUMNS)
+        .where(Task.updated_at > datetime.now(timezone.utc) - timedelta(hours=1)),
+    }
+
+
+def explain(connection, statement) -> tuple[list[str], set[str]]:
+    """
+    Returns the plan lines of a statement and the tables it reads with full scans.
+    """
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    if connection.dialect.name == "postgresql":
+        lines = [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)]
+        scanned = {match.group(1) for line in lines for match in _POSTGRES_SEQ_SCAN.finditer(line)}
+    else:
+        parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+        lines = [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters)]
+        scanned = {match.group(1) for line in lines if (match := _SQLITE_SCAN.match(line))}
+    return lines, scanned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if the main queries use sequential scans.")
+    parser.add_argument("--min-rows", type=int, default=10_000, help="Smaller tables may be scanned")
+    parser.add_argument("--verbose", action="store_true", help="Print every plan, not only the failing ones")
+    args = parser.parse_args()
+
+    failures = 0
+    with engine.connect() as connection:
+        # Fresh statistics, since the data was probably just bulk loaded
+        connection.execute(text("ANALYZE"))
+        sizes = {table: connection.scalar(select(func.count()).select_from(text(table))) for table in CHECKED_TABLES}
+        queries = build_queries(sample_parameters(connection))
+
+        for name, statement in queries.items():
+            lines, scanned = explain(connection, statement)
+            bad = sorted(table for table in scanned if table in sizes and sizes[table] >= args.min_rows)
+            small = sorted(table for table in scanned if table in sizes and sizes[table] < args.min_rows)
+            if bad:
+                failures += 1
+                print(f"FAIL {name}: sequential scan on {', '.join(bad)}")
+            else:
+                note = f" (small tables scanned: {', '.join(small)})" if small else ""
+                print(f"ok   {name}{note}")
+            if bad or args.verbose:
+                print("\n".join(f"       {line}" for line in lines))
+
+    print(f"\n{len(queries) - failures} of {len(queries)} queries use indexes on tables of {args.min_rows:,}+ rows.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
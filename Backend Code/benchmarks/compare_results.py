@@ -0,0 +1,42 @@
+# benchmarks/compare_results.py
+"""
+Prints the change between two run_benchmark.py result files:
+
+    python benchmarks/compare_results.py results/before.json results/after.json
+"""
+import argparse
+import json
+
+METRICS = [("rps", lambda result: result["rps"])] + [
+    (name, lambda result, name=name: result["latency_ms"][name]) for name in ("p50", "p95", "p99")
+]
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    print(f"before: {before['git']['commit']} {before.get('label', '')}")
+    print(f"after:  {after['git']['commit']} {after.get('label', '')}")
+    print(f"{'scenario':<16} {'metric':<5} {'before':>10} {'after':>10} {'change':>9}")
+    for scenario in before["scenarios"]:
+        if scenario not in after["scenarios"]:
+            continue
+        for metric, value in METRICS:
+            old, new = value(before["scenarios"][scenario]), value(after["scenarios"][scenario])
+            print(f"{scenario:<16} {metric:<5} {old:>10.2f} {new:>10.2f} {change(old, new):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# benchmarks/generate_data.py
+"""
+Fills the database configured by DATABASE_URL with synthetic data for load testing.
+
+    python benchmarks/generate_data.py --scale medium --reset
+    python benchmarks/generate_data.py --users 50000 --tasks 20000000
+
+The rows are written by seed.py's bulk mode (COPY on PostgreSQL), which only adds
+what is missing, so a larger scale can be loaded on top of a smaller one.
+"""
+import argparse
+import os
+import sys
+
+# Add the backend root to the sys.path to allow imports like 'database' and 'models'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Base, engine
+from seed import add_bulk_arguments, seed_bulk, seed_database
+
+SCALES = {
+    "small": dict(users=1_000, groups=50, memberships_per_user=2, companies=200, tasks=100_000, events=500),
+    "medium": dict(users=10_000, groups=300, memberships_per_user=3, companies=2_000, tasks=2_000_000, events=5_000),
+    "large": dict(users=50_000, groups=1_000, memberships_per_user=3, companies=10_000, tasks=20_000_000, events=20_000),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic data for load testing.")
+    parser.add_argument("--scale", choices=SCALES, default="small", help="Preset sizes, overridden by the options below")
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate every table first (deletes all data)")
+    add_bulk_arguments(parser, dict.fromkeys(SCALES["small"]))
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+
+    if args.reset:
+        print("Dropping and recreating all tables...")
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    seed_database()
+    seed_bulk(batch_size=args.batch_size, seed=args.seed, **sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# benchmarks/run_benchmark.py
+"""
+Load test for a running API, usually one filled by generate_data.py:
+
+    uvicorn main:app --workers 4
+    python benchmarks/run_benchmark.py --concurrency 50 --duration 30
+
+Each scenario drives one endpoint with --concurrency parallel clients for --duration
+seconds and records p50/p95/p99 latency and requests per second. The results are
+written as JSON tagged with the current git commit, so two runs can be compared
+with compare_results.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+# The accounts and names created by seed.py --bulk
+SYNTHETIC_ADMIN_EMAIL = "synthetic-admin@example.com"
+SYNTHETIC_USER_EMAIL = "synthetic-user-{n}@example.com"
+SYNTHETIC_PASSWORD = "synthetic"
+SEARCH_TERMS = ["maria", "papadop", "kostas", "georgiou", "eleni kar", "synthetic-user-42", "nikos", "ioannou"]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def git_revision() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BENCHMARK_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+class Session:
+    """
+    A logged-in benchmark user: their token and the groups they belong to.
+    """
+
+    def __init__(self, email: str, token: str, group_ids: list[int]):
+        self.email = email
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.group_ids = group_ids
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> httpx.Response:
+    return await client.post("/token", data={"username": email, "password": password})
+
+
+async def open_session(client: httpx.AsyncClient, email: str, password: str) -> Session:
+    response = await login(client, email, password)
+    response.raise_for_status()
+    session = Session(email, response.json()["access_token"], [])
+    groups = await client.get("/groups/", headers=session.headers)
+    groups.raise_for_status()
+    session.group_ids = [group["id"] for group in groups.json()]
+    return session
+
+
+def build_scenarios(admin: Session, users: list[Session], password: str, page_size: int) -> dict:
+    """
+    Maps each scenario name to a function issuing one request with a random user.
+    """
+    members = [user for user in users if user.group_ids] or [admin]
+
+    async def token(client, rng):
+        return await login(client, rng.choice(users).email, password)
+
+    async def tasks(client, rng):
+        return await client.get("/tasks/", params={"limit": page_size}, headers=rng.choice(users).headers)
+
+    async def calendar_events(client, rng):
+        return await client.get("/calendar/events", headers=rng.choice(users).headers)
+
+    async def group_tasks(client, rng):
+        user = rng.choice(members)
+        group_id = rng.choice(user.group_ids) if user.group_ids else 1
+        return await client.get(f"/groups/{group_id}/tasks", params={"limit": page_size}, headers=user.headers)
+
+    async def user_search(client, rng):
+        return await client.get("/users/all", params={"search": rng.choice(SEARCH_TERMS)}, headers=admin.headers)
+
+    return {
+        "token": token,
+        "tasks": tasks,
+        "calendar_events": calendar_events,
+        "group_tasks": group_tasks,
+        "user_search": user_search,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, request, concurrency: int, duration: float,
+                       max_requests: int, seed: int) -> dict:
+    latencies: list[float] = []
+    status_codes: dict[str, int] = {}
+    errors = 0
+    started = time.perf_counter()
+    deadline = started + duration
+    issued = 0
+
+    async def worker(worker_id: int):
+        nonlocal errors, issued
+        rng = random.Random(seed + worker_id)
+        while time.perf_counter() < deadline and (not max_requests or issued < max_requests):
+            issued += 1
+            request_started = time.perf_counter()
+            try:
+                response = await request(client, rng)
+            except httpx.HTTPError as error:
+                errors += 1
+                key = type(error).__name__
+            else:
+                latencies.append(time.perf_counter() - request_started)
+                key = str(response.status_code)
+                if response.status_code >= 400:
+                    errors += 1
+            status_codes[key] = status_codes.get(key, 0) + 1
+
+    await asyncio.gather(*(worker(worker_id) for worker_id in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    to_ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        "requests": sum(status_codes.values()),
+        "errors": errors,
+        "status_codes": status_codes,
+        "elapsed_seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": to_ms(percentile(latencies, 0.50)),
+            "p95": to_ms(percentile(latencies, 0.95)),
+            "p99": to_ms(percentile(latencies, 0.99)),
+            "mean": to_ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+            "max": to_ms(latencies[-1]) if latencies else 0.0,
+        },
+    }
+
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        print(f"Logging in {args.users} benchmark users...")
+        admin = await open_session(client, args.admin_email, args.password)
+        emails = [args.user_email.format(n=n) for n in range(1, args.users + 1)]
+        users = await asyncio.gather(*(open_session(client, email, args.password) for email in emails))
+
+        scenarios = build_scenarios(admin, list(users), args.password, args.page_size)
+        selected = args.scenarios or list(scenarios)
+        results = {}
+        for name in selected:
+            if args.warmup:
+                await run_scenario(client, scenarios[name], args.concurrency, args.warmup, 0, args.seed)
+            print(f"Running {name} for {args.duration}s at concurrency {args.concurrency}...")
+            results[name] = await run_scenario(
+                client, scenarios[name], args.concurrency, args.duration, args.max_requests, args.seed
+            )
+            latency = results[name]["latency_ms"]
+            print(f"  {results[name]['rps']:>9.1f} req/s  p50 {latency['p50']:>8.2f} ms  "
+                  f"p95 {latency['p95']:>8.2f} ms  p99 {latency['p99']:>8.2f} ms  errors {results[name]['errors']}")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the main API endpoints.")
+    parser.add_argument("--base-url", default=os.getenv("BENCHMARK_BASE_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight at any time")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run each scenario")
+    parser.add_argument("--max-requests", type=int, default=0, help="Stop a scenario after this many requests (0: no limit)")
+    parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds before each scenario")
+    parser.add_argument("--scenarios", nargs="*", choices=["token", "tasks", "calendar_events", "group_tasks", "user_search"])
+    parser.add_argument("--users", type=int, default=20, help="Distinct users the requests are spread over")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--admin-email", default=SYNTHETIC_ADMIN_EMAIL)
+    parser.add_argument("--user-email", default=SYNTHETIC_USER_EMAIL, help="Pattern for the other users")
+    parser.add_argument("--password", default=SYNTHETIC_PASSWORD)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="", help="Free text stored with the results, e.g. the dataset scale")
+    parser.add_argument("--output", help=f"Result file (default: {RESULTS_DIR}/<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    started_at = datetime.now(timezone.utc)
+    scenarios = asyncio.run(run(args))
+    revision = git_revision()
+    report = {
+        "started_at": started_at.isoformat(),
+        "label": args.label,
+        "git": revision,
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            key: getattr(args, key)
+            for key in ("base_url", "concurrency", "duration", "max_requests", "warmup", "users", "page_size", "seed")
+        },
+        "scenarios": scenarios,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        short_commit = (revision["commit"] or "nogit")[:10] + ("-dirty" if revision["dirty"] else "")
+        output = os.path.join(RESULTS_DIR, f"{started_at:%Y%m%dT%H%M%SZ}-{short_commit}.json")
+    with open(output, "w") as result_file:
+        json.dump(report, result_file, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# import_companies.py
+"""
+Imports companies from a CSV or JSON file, with the same checks as POST /companies/bulk.
+
+    python import_companies.py clients.csv --dry-run   # only report what would fail
+    python import_companies.py clients.csv
+    python import_companies.py clients.json            # [{...}, ...] or {"items": [...]}
+
+CSV files need a header row (name, vat_number, occupation, creation_date, description;
+only name is required). Rows that fail are listed with their line number and the
+others are saved in one transaction.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import os
+import time
+
+# Add the project root to the sys.path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+from database import session_scope
+from routers.companies import import_companies, parse_company_csv
+
+
+def read_items(path: str):
+    """
+    Returns the items in the file and a function naming an item's place in it.
+    """
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        text = file.read()
+    if path.lower().endswith(".csv"):
+        # The header is line 1; rows with line breaks inside quotes shift later numbers
+        return parse_company_csv(text), lambda index: f"line {index + 2}"
+    payload = json.loads(text)
+    return (payload.get("items", []) if isinstance(payload, dict) else payload), lambda index: f"item {index}"
+
+
+async def run(items: list, position, dry_run: bool) -> int:
+    async with session_scope() as db:
+        report = await import_companies(db, items, dry_run)
+    for result in report.results:
+        if result.status_code >= 400:
+            print(f"  {position(result.index)}: {result.detail}")
+    verb = "would be created" if dry_run else "created"
+    print(f"{report.created:,} companies {verb}, {report.failed:,} rejected.")
+    return report.failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import companies from a CSV or JSON file.")
+    parser.add_argument("path")
+    parser.add_argument("--dry-run", action="store_true", help="Check the file without saving anything")
+    args = parser.parse_args()
+
+    try:
+        items, position = read_items(args.path)
+    except (OSError, ValueError) as error:
+        sys.exit(f"Could not read {args.path}: {error}")
+    started = time.perf_counter()
+    failures = asyncio.run(run(items, position, args.dry_run))
+    print(f"Done in {time.perf_counter() - started:,.1f}s.")
+    sys.exit(1 if failures else 0)
@@ -1,13 +1,32 @@
-from fastapi import FastAPI
+import utils.logging_init  # Must stay first: sets up logging before the other imports run
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
-from database import engine
-from routers import auth, tasks, groups, calendar, companies, events  # <-- Import events
+from database import async_engine, engine
+from routers import auth, tasks, groups, calendar, companies, events, admin, realtime, exports  # <-- Import events
+from routers.pagination import NEXT_CURSOR_HEADER
+from utils.logging_setup import REQUEST_ID_HEADER, RequestIdMiddleware
+from utils.email_outbox import email_dispatcher, start_email_dispatcher
+from utils.realtime import realtime_broker
+from utils.metrics import registry
+from utils.request_metrics import METRICS_ENABLED, METRICS_PATH, MetricsMiddleware, instrument_engine
+from utils.query_recorder import QUERY_DEBUG, QueryRecorderMiddleware, record_queries_on
 import os
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background sender for the email outbox
+    start_email_dispatcher()
+    # Fan-out of change notifications to /realtime/stream clients
+    await realtime_broker.start()
+    yield
+    await realtime_broker.stop()
+    email_dispatcher.stop()
+
 # Initialize the app with the default documentation URLs turned off
 # We will create our own custom /docs route
-app = FastAPI(docs_url=None, redoc_url=None, title="BWC Portal API")
+app = FastAPI(docs_url=None, redoc_url=None, title="BWC Portal API", lifespan=lifespan)
 
 # Custom /docs endpoint that uses a different CDN for Swagger UI
 @app.get("/docs", include_in_schema=False)
@@ -33,8 +52,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the frontend read the keyset pagination cursor and the request id
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER],
 )
 
+# Request/DB metrics in Prometheus format, switched on with METRICS_ENABLED
+if METRICS_ENABLED:
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get(METRICS_PATH, include_in_schema=False)
+    def prometheus_metrics():
+        return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
+
+# Development aid: per-request query recording, N+1 detection and query budgets
+if QUERY_DEBUG:
+    record_queries_on(engine)
+    if async_engine is not None:
+        record_queries_on(async_engine.sync_engine)
+    app.add_middleware(QueryRecorderMiddleware)
+
+# Added last so it runs first: everything logged while serving a request carries its id
+app.add_middleware(RequestIdMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(tasks.router)
@@ -42,6 +84,9 @@ app.include_router(groups.router)
 app.include_router(calendar.router)
 app.include_router(companies.router)
 app.include_router(events.router)  # <-- Add this line
+app.include_router(admin.router)
+app.include_router(realtime.router)
+app.include_router(exports.router)
 
 @app.get("/")
 def read_root():
@@ -1,14 +1,32 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, DateTime, Table
-from sqlalchemy.orm import relationship
-from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, DateTime, Table, Index, DDL, event
+from sqlalchemy.orm import relationship, validates
+from datetime import date, datetime, timezone
 from database import Base
 
+# Trigram indexes (used by the admin user search) need the pg_trgm extension
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+def trigram_index(name: str, column: str) -> Index:
+    """
+    GIN trigram index that lets PostgreSQL answer ILIKE '%term%' and similarity
+    lookups on a text column without a sequential scan. Skipped on other databases.
+    """
+    return Index(
+        name, column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"}
+    ).ddl_if(dialect="postgresql")
+
 # This is the association table for the many-to-many relationship between users and groups
 group_members = Table(
     "group_members",
     Base.metadata,
-    Column("group_id", Integer, ForeignKey("groups.id")),
-    Column("user_id", Integer, ForeignKey("users.id"))
+    # The (group_id, user_id) primary key rules out duplicate memberships and answers
+    # "members of a group"; the user_id index answers "groups of a user"
+    Column("group_id", Integer, ForeignKey("groups.id"), primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True, index=True)
 )
 
 class User(Base):
@@ -19,13 +37,32 @@ class User(Base):
     first_name = Column(String, nullable=True)
     surname = Column(String, nullable=True)
     birthday = Column(Date, nullable=True)
+    # Birthday encoded as month * 100 + day (e.g. 1230 for 30 December) so the calendar
+    # can look up birthdays in a date window with an index instead of scanning every user
+    birthday_month_day = Column(Integer, nullable=True, index=True)
     role = Column(String, default="user", nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
+    # Secret in the URL of the user's iCalendar feed (GET /calendar/feed/{token}.ics)
+    calendar_token = Column(String, unique=True, index=True, nullable=True)
+    # Last time the set of tasks the user may see changed (group joined or left, group
+    # deleted, role changed); GET /tasks/changes answers 410 for older 'since' values
+    visibility_changed_at = Column(DateTime(timezone=True), nullable=True)
 
     tasks = relationship("Task", back_populates="owner")
     groups = relationship("Group", secondary=group_members, back_populates="members")
     events = relationship("Event", back_populates="creator")
 
+    __table_args__ = (
+        trigram_index("ix_users_email_trgm", "email"),
+        trigram_index("ix_users_first_name_trgm", "first_name"),
+        trigram_index("ix_users_surname_trgm", "surname"),
+    )
+
+    @validates("birthday")
+    def _sync_birthday_month_day(self, key, value):
+        self.birthday_month_day = value.month * 100 + value.day if value else None
+        return value
+
 class Task(Base):
     __tablename__ = "tasks"
     id = Column(Integer, primary_key=True, index=True)
@@ -42,12 +79,70 @@ class Task(Base):
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
+    # Change tracking for GET /tasks/changes
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        index=True,
+    )
     
     owner = relationship("User", back_populates="tasks")
     group = relationship("Group", back_populates="tasks")
     # --- THE FIX: The back_populates argument now correctly points to "tasks" ---
     company = relationship("Company", back_populates="tasks")
 
+    __table_args__ = (
+        # Visible tasks of a user (owner_id = ? OR group_id IN (...)) and their calendar window
+        Index("ix_tasks_owner_id_deadline", "owner_id", "deadline"),
+        # Keyset pages of GET /groups/{id}/tasks, read in id order without sorting
+        Index("ix_tasks_group_id_id", "group_id", "id"),
+        # The admin calendar window
+        Index("ix_tasks_deadline", "deadline"),
+        # Unlinking the tasks of a deleted company
+        Index("ix_tasks_company_id", "company_id"),
+    )
+
+
+class TaskTombstone(Base):
+    """
+    Records a deleted task, with the owner and group it had, so GET /tasks/changes can
+    tell the users who could see it to drop it. Kept for TASK_TOMBSTONE_RETENTION_DAYS.
+    """
+    __tablename__ = "task_tombstones"
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, nullable=False)
+    group_id = Column(Integer, nullable=True)
+    deleted_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+
+# due_date of tasks that are completed or have no deadline, so they are never overdue
+NO_DUE_DATE = date(9999, 12, 31)
+# due_date of open tasks whose deadline day had already passed when they were counted.
+# A day in the past stays in the past, so all of them can share one row per key.
+PAST_DUE_DATE = date(1, 1, 1)
+
+class TaskStat(Base):
+    """
+    Number of tasks overall and per user, group or company with a given status,
+    Eisenhower quadrant and due day, kept up to date by the task routes in the same
+    transaction as the change (see utils/task_stats.py). Overdue and due-this-week counts
+    are summed from due_date when GET /tasks/stats is read, so the rows never go stale as
+    days pass.
+    """
+    __tablename__ = "task_stats"
+    scope = Column(String, primary_key=True)  # "all", "user" (the owner), "group" or "company"
+    scope_id = Column(Integer, primary_key=True)  # 0 for "all"
+    status = Column(String, primary_key=True)
+    urgency = Column(Boolean, primary_key=True)
+    important = Column(Boolean, primary_key=True)
+    # Deadline day of open tasks (PAST_DUE_DATE once it has passed), NO_DUE_DATE for the rest
+    due_date = Column(Date, primary_key=True)
+    task_count = Column(Integer, default=0, nullable=False)
+
 
 class Group(Base):
     __tablename__ = "groups"
@@ -86,7 +181,31 @@ class Event(Base):
     title = Column(String, index=True, nullable=False)
     description = Column(String, nullable=True)
     location = Column(String, nullable=False)
-    event_date = Column(DateTime(timezone=True), nullable=False)
+    event_date = Column(DateTime(timezone=True), nullable=False, index=True)
     
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     creator = relationship("User", back_populates="events")
+
+class EmailOutbox(Base):
+    """
+    Outgoing email waiting to be sent by the background dispatcher. Rows are written in
+    the same transaction as the change that triggers them, so a rolled back request
+    never sends mail and a committed one is never lost.
+    """
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    # "pending", "sent" or "dead" (gave up after EMAIL_MAX_ATTEMPTS or a permanent error)
+    status = Column(String, default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # The dispatcher polls for due pending rows
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
@@ -0,0 +1,25 @@
+# rebuild_task_stats.py
+"""
+Recomputes the task_stats summary table behind GET /tasks/stats from the tasks table.
+
+    python rebuild_task_stats.py
+
+The API keeps the table up to date by itself; run this after loading or editing tasks
+outside the API (e.g. with SQL), or to drop the rows whose counts have fallen to zero.
+It is safe while the API is running: on PostgreSQL task changes wait for it to finish.
+"""
+import sys
+import os
+import time
+
+# Add the project root to the sys.path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+from database import engine
+from utils.task_stats import rebuild_task_stats
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        written = rebuild_task_stats(connection)
+    print(f"Rebuilt task_stats: {written:,} rows in {time.perf_counter() - started:,.1f}s.")
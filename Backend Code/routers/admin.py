@@ -0,0 +1,55 @@
+# routers/admin.py
+from fastapi import APIRouter, Depends
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db, get_pool_stats
+from models import EmailOutbox
+from utils.email_outbox import email_dispatcher
+from utils.password_hashing import password_hasher
+from utils.principal_cache import Principal, principal_cache
+from .auth import get_current_user
+from .utils import check_roles
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/principal-cache", response_model=dict)
+async def get_principal_cache_stats(current_user: Principal = Depends(get_current_user)):
+    """
+    Returns hit/miss counters and the current size of the authenticated-user cache. Admin only.
+    """
+    check_roles(current_user, ["admin"])
+    return principal_cache.stats()
+
+@router.get("/db-pool", response_model=dict)
+async def get_db_pool_stats(current_user: Principal = Depends(get_current_user)):
+    """
+    Returns live connection pool statistics: connections checked out, overflow in use,
+    the checkout wait time histogram and the number of checkout timeouts. Admin only.
+    """
+    check_roles(current_user, ["admin"])
+    return get_pool_stats()
+
+@router.get("/password-hashing", response_model=dict)
+async def get_password_hashing_stats(current_user: Principal = Depends(get_current_user)):
+    """
+    Returns the bcrypt pool settings, jobs in flight, rejected (503) requests, rehashes
+    done on login and the queue wait / hashing time histograms. Admin only.
+    """
+    check_roles(current_user, ["admin"])
+    return password_hasher.stats()
+
+@router.get("/email-outbox", response_model=dict)
+async def get_email_outbox_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Returns the number of outbox messages per status (pending, sent, dead) and the
+    dispatcher's counters since startup. Admin only.
+    """
+    check_roles(current_user, ["admin"])
+    counts = (await db.execute(
+        select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status)
+    )).all()
+    return {"messages": {status: count for status, count in counts}, "dispatcher": email_dispatcher.stats()}
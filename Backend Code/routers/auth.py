@@ -1,24 +1,36 @@
+import logging
 import os
 from fastapi import APIRouter, Depends, HTTPException, status, Form, Query, Response  # No UploadFile, File from previous revert
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
-from database import get_db
-from models import User, PasswordResetToken  # <--- IMPORT PasswordResetToken
-from schemas import UserCreate, UserResponse, Token, UserUpdate, UserRoleUpdate, UserStatusUpdate, PasswordResetRequest, PasswordReset  # <--- IMPORT PasswordResetRequest, PasswordReset
+from database import get_async_db
+from sqlalchemy import case, func, or_, select, update
+from models import User, PasswordResetToken, group_members  # <--- IMPORT PasswordResetToken
+from schemas import full_name, UserCreate, UserResponse, Token, UserUpdate, UserRoleUpdate, UserStatusUpdate, PasswordResetRequest, PasswordReset  # <--- IMPORT PasswordResetRequest, PasswordReset
 from typing import Optional, List
 from .utils import check_roles
+from .pagination import PageParams, page_params, paginate_rows
 import uuid  # Still needed for UUID for tokens
-from utils.email_sender import send_email  # <--- IMPORT send_email UTILITY
+from utils.email_outbox import email_dispatcher, enqueue_email
+from utils.fast_json import fast_json_response, schema_columns
+from utils.calendar_cache import calendar_cache
+from utils.password_hashing import PasswordHasherBusy, password_hasher, pwd_context
+from utils.principal_cache import Principal, principal_cache
 
 # Load secret key and token expiration from environment variables (or use defaults)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-for-development")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 240))
+# Maximum number of results returned by the admin user search
+USER_SEARCH_LIMIT = int(os.getenv("USER_SEARCH_LIMIT", 50))
+
+# Columns of a UserResponse, selected as plain tuples by the fast list endpoints
+USER_COLUMNS = schema_columns(UserResponse, User)
+
+logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
 router = APIRouter()
@@ -29,6 +41,22 @@ def get_password_hash(password):
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password(password: str) -> str:
+    """
+    Hashes a password on the dedicated bcrypt pool, answering 503 when it is saturated.
+    """
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise_hashing_busy()
+
+def raise_hashing_busy():
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in requests right now, please try again shortly.",
+        headers={"Retry-After": "1"},
+    )
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=120))
@@ -36,52 +64,100 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def load_principal(db: AsyncSession, user_id: int) -> Optional[Principal]:
+    """
+    Reads a user and their group ids from the database and caches the result.
+    """
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if user is None:
+        return None
+    group_ids = (await db.scalars(
+        select(group_members.c.group_id).where(group_members.c.user_id == user_id)
+    )).all()
+    principal = Principal(
+        id=user.id,
+        email=user.email,
+        role=user.role,
+        is_active=user.is_active,
+        group_ids=frozenset(group_ids),
+    )
+    principal_cache.set(principal)
+    return principal
+
+def decode_token(token: str) -> dict:
+    """
+    Checks a signed token (signature and expiry) and returns its claims, or answers 401.
+    """
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    """
+    Resolves the bearer token to a Principal. Principals are served from an in-memory
+    TTL cache so most requests do not touch the users table; writes that change a
+    user's role, status or group membership invalidate their entry.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("id")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+    payload = decode_token(token)
+    user_id = payload.get("id")
+    # Tokens issued for one purpose only (e.g. realtime stream tickets) are not access tokens
+    if user_id is None or payload.get("purpose") is not None:
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
+    principal = principal_cache.get(user_id) or await load_principal(db, user_id)
+    if principal is None:
         raise credentials_exception
-    return user
+    if not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="This account has been deactivated.")
+    return principal
 
 @router.post("/token", response_model=Token)
-def login(
+async def login(
     username: str = Form(),
     password: str = Form(),
     grant_type: str = Form(default="password"),
     scope: str = Form(default=""),
     client_id: Optional[str] = Form(default=None),
     client_secret: Optional[str] = Form(default=None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.email == username).first()
-    if not user or not verify_password(password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.email == username))
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+        except PasswordHasherBusy:
+            raise_hashing_busy()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # The stored hash used older bcrypt settings; replace it while we have the password
+    if new_hash is not None:
+        user.hashed_password = new_hash
+        await db.commit()
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": user.email, "id": user.id}, expires_delta=access_token_expires)
     return Token(access_token=access_token, token_type="bearer")
 
 @router.post("/register", response_model=UserResponse)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User).where(User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     new_user = User(
         email=user.email,
         hashed_password=hashed_password,
@@ -93,69 +169,112 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         birthday=user.birthday
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    if new_user.birthday:
+        calendar_cache.invalidate_all()
     return new_user
 
 @router.get("/users/me", response_model=UserResponse)  # <--- ADD response_model=UserResponse BACK
-def read_users_me(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # Remove the debug print if it's here
-    # print(f"DEBUG_BACKEND: read_users_me - current_user before return: ...")
-    # --- Revert to original simple return ---
-    return current_user
+async def read_users_me(db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    user = await db.scalar(select(User).where(User.id == current_user.id))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 # --- END Revert ---
 
 @router.put("/users/me", response_model=UserResponse)
-def update_user_me(
+async def update_user_me(
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
+    user = await db.scalar(select(User).where(User.id == current_user.id))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     if user_update.first_name is not None:
-        current_user.first_name = user_update.first_name
+        user.first_name = user_update.first_name
     if user_update.surname is not None:
-        current_user.surname = user_update.surname
+        user.surname = user_update.surname
     if user_update.birthday is not None:
-        current_user.birthday = user_update.birthday
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+        user.birthday = user_update.birthday
+    await db.commit()
+    await db.refresh(user)
+    # Birthdays are shown to everyone, titled with the user's first name
+    if user.birthday and (user_update.birthday is not None or user_update.first_name is not None):
+        calendar_cache.invalidate_all()
+    return user
+
+def user_response_rows(rows: list[dict]) -> list[dict]:
+    # Adds UserResponse's computed full_name to plain user rows
+    return [{**row, "full_name": full_name(row["first_name"], row["surname"])} for row in rows]
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def build_user_search_query(term: str, dialect_name: str, limit: int):
+    """
+    Builds the ranked admin user search. On PostgreSQL the substring match and the
+    trigram similarity operator are answered from the GIN trigram indexes and results
+    are ranked by similarity; other databases (e.g. SQLite test databases) fall back to
+    a plain ILIKE, ranking prefix matches first.
+    """
+    pattern = f"%{_escape_like(term)}%"
+    columns = (User.email, User.first_name, User.surname)
+    matches = [column.ilike(pattern, escape="\\") for column in columns]
+
+    if dialect_name == "postgresql":
+        # '%' is pg_trgm's "similar to" operator, which also catches small typos
+        matches += [column.op("%")(term) for column in columns]
+        rank = func.greatest(*[func.coalesce(func.similarity(column, term), 0) for column in columns])
+        order_by = [rank.desc(), User.id]
+    else:
+        prefix = f"{_escape_like(term)}%"
+        rank = case(
+            (or_(*[column.ilike(prefix, escape="\\") for column in columns]), 0),
+            else_=1,
+        )
+        order_by = [rank, User.id]
+
+    return select(User).where(or_(*matches)).order_by(*order_by).limit(limit)
 
 @router.get("/users/all", response_model=List[UserResponse])
-def list_all_users(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+async def list_all_users(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
     search: Optional[str] = Query(None, description="Search users by email or full name")
 ):
     check_roles(current_user, ["admin"])
-    query = db.query(User)
-    if search:
-        search_pattern = f"%{search.lower()}%"
-        query = query.filter(
-            (User.email.ilike(search_pattern)) |
-            (User.first_name.ilike(search_pattern)) |
-            (User.surname.ilike(search_pattern))
-        )
-    return query.all()
+    if search and search.strip():
+        # Search results are ranked by relevance and capped, so they are not paginated
+        query = build_user_search_query(
+            search.strip(), db.bind.dialect.name, min(page.limit, USER_SEARCH_LIMIT)
+        ).with_only_columns(*USER_COLUMNS)
+        rows = [row._asdict() for row in (await db.execute(query)).all()]
+    else:
+        rows = await paginate_rows(db, select(*USER_COLUMNS), [User.id], page, response)
+    return fast_json_response(user_response_rows(rows), response)
 
 # <--- NEW ADMIN PANEL ENDPOINTS ---
 @router.get("/users/{user_id}", response_model=UserResponse)  # <--- NEW: Get User by ID
-def get_user_by_id(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_user_by_id(user_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     check_roles(current_user, ["admin"])  # Only admins can get any user by ID
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @router.put("/users/{user_id}/role", response_model=UserResponse)  # <--- NEW: Update User Role
-def update_user_role(user_id: int, role_update: UserRoleUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def update_user_role(user_id: int, role_update: UserRoleUpdate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     check_roles(current_user, ["admin"])  # Only admins can update roles
 
     if user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Admins cannot change their own role via this endpoint. Use direct DB access for self-demotion/promotion if needed.")
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -164,49 +283,57 @@ def update_user_role(user_id: int, role_update: UserRoleUpdate, db: Session = De
     if role_update.role not in allowed_roles:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid role: {role_update.role}. Allowed roles are: {', '.join(allowed_roles)}")
 
+    if user.role != role_update.role:
+        # Admins see every task, other users only theirs and their groups'
+        user.visibility_changed_at = datetime.now(timezone.utc)
     user.role = role_update.role
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    calendar_cache.invalidate_users([user.id], include_admins=False)
+    principal_cache.invalidate([user.id])
     return user
 
 @router.put("/users/{user_id}/status", response_model=UserResponse)  # <--- NEW: Toggle User Active Status
-def update_user_status(user_id: int, status_update: UserStatusUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def update_user_status(user_id: int, status_update: UserStatusUpdate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     check_roles(current_user, ["admin"])  # Only admins can update status
 
     if user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Admins cannot deactivate their own account via this endpoint. Contact another admin or use direct DB access.")
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     user.is_active = status_update.is_active
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate([user.id])
     return user
 
 @router.delete("/users/{user_id}", status_code=204)  # <--- NEW: Delete User
-def delete_user(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     check_roles(current_user, ["admin"])  # Only admins can delete users
 
     if user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Admins cannot delete their own account.")
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
+    calendar_cache.invalidate_all()
+    principal_cache.invalidate([user_id])
     return Response(status_code=204)
 # <--- END NEW ADMIN PANEL ENDPOINTS ---
 
 # <--- NEW PASSWORD RESET ENDPOINTS ---
 @router.post("/auth/request-password-reset", response_model=dict)
-def request_password_reset(request: PasswordResetRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == request.email).first()
+async def request_password_reset(request: PasswordResetRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.email == request.email))
     if not user:
-        print(f"DEBUG_BACKEND: request_password_reset - User not found for email: {request.email}. Returning generic message.")
+        logger.debug("request_password_reset - User not found for email: %s. Returning generic message.", request.email)
         return {"message": "If an account with that email exists, a password reset link has been sent."}
 
     # Generate a unique token
@@ -215,13 +342,14 @@ def request_password_reset(request: PasswordResetRequest, db: Session = Depends(
     expires_at_dt = current_utc_time + timedelta(minutes=60)
 
     # Invalidate any old tokens for this user before creating a new one (good practice)
-    db.query(PasswordResetToken).filter(
-        PasswordResetToken.user_id == user.id,
-        PasswordResetToken.is_used == False
-    ).update({"is_used": True})
-    db.commit()  # Commit the invalidation of old tokens
+    await db.execute(
+        update(PasswordResetToken)
+        .where(PasswordResetToken.user_id == user.id, PasswordResetToken.is_used == False)
+        .values(is_used=True)
+    )
+    await db.commit()  # Commit the invalidation of old tokens
 
-    db_token = db.query(PasswordResetToken).filter(PasswordResetToken.user_id == user.id).first()  # Re-query after invalidation
+    db_token = await db.scalar(select(PasswordResetToken).where(PasswordResetToken.user_id == user.id))  # Re-query after invalidation
     if db_token:
         # Update existing token (if one was just invalidated or existed)
         db_token.token = token
@@ -237,8 +365,6 @@ def request_password_reset(request: PasswordResetRequest, db: Session = Depends(
             created_at=current_utc_time
         )
         db.add(db_token)
-    db.commit()
-    db.refresh(db_token)
 
     # Construct the reset link (Frontend URL will be adjusted later)
     reset_link = f"http://localhost:5173/reset-password?token={token}"
@@ -259,38 +385,39 @@ def request_password_reset(request: PasswordResetRequest, db: Session = Depends(
     Thank you,
     The BWC Portal Team
     """
-    # Send the email
-    print(f"DEBUG_BACKEND: Attempting to send reset email to: {user.email}")  # <--- ADD THIS LINE
-    send_email(to_email=user.email, subject=email_subject, body=email_body)
+    # Queue the email in the same transaction as the token; the dispatcher sends it
+    logger.info("Queueing password reset email to %s", user.email)
+    enqueue_email(db, to_email=user.email, subject=email_subject, body=email_body)
+    await db.commit()
+    email_dispatcher.wake()
 
-    print(f"DEBUG_BACKEND: request_password_reset returning: {{'message': 'If an account with that email exists, a password reset link has been sent.'}}")
     return {"message": "If an account with that email exists, a password reset link has been sent."}
 
 
 @router.post("/auth/reset-password", response_model=dict)
-def reset_password(request: PasswordReset, db: Session = Depends(get_db)):
-    reset_token = db.query(PasswordResetToken).filter(
+async def reset_password(request: PasswordReset, db: AsyncSession = Depends(get_async_db)):
+    reset_token = await db.scalar(select(PasswordResetToken).where(
         PasswordResetToken.token == request.token,
         PasswordResetToken.is_used == False  # Ensure token is not already used
-    ).first()
+    ))
 
     if not reset_token:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid or expired token.")
 
     if reset_token.expires_at < datetime.now(timezone.utc):
         reset_token.is_used = True  # Mark as used even if expired
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid or expired token.")
 
-    user = db.query(User).filter(User.id == reset_token.user_id).first()
+    user = await db.scalar(select(User).where(User.id == reset_token.user_id))
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found for this token.")
 
     # Update password
-    user.hashed_password = get_password_hash(request.new_password)
+    user.hashed_password = await hash_password(request.new_password)
     reset_token.is_used = True  # Mark token as used after successful reset
-    db.commit()  # Commit user password update and token use status
-    db.refresh(user)
+    await db.commit()  # Commit user password update and token use status
+    await db.refresh(user)
 
     return {"message": "Password has been successfully reset."}
 # <--- END NEW PASSWORD RESET ENDPOINTS ---
\ No newline at end of file
@@ -1,71 +1,275 @@
 # routers/calendar.py
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from database import get_db
+import calendar as calendar_module
+import os
+import secrets
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import User, Task, Event # Import Event model
 from schemas import CalendarEvent
-from .auth import get_current_user
-from datetime import date, datetime
+from utils.calendar_cache import CachedCalendar, calendar_cache, etag_matches
+from utils.fast_json import FAST_JSON_ENABLED, dumps
+from utils.ics import render_calendar
+from utils.principal_cache import Principal, principal_cache
+from utils.query_recorder import max_queries
+from .auth import get_current_user, load_principal
+from datetime import date, datetime, time, timedelta, timezone
 from typing import List, Optional
 
 router = APIRouter(prefix="/calendar", tags=["calendar"])
 
-@router.get("/events", response_model=List[CalendarEvent])
-def get_calendar_events(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
+# Widest window (in days) a single calendar request may cover. Requests without
+# bounds, or with bounds further apart than this, are cut down to this span.
+CALENDAR_MAX_SPAN_DAYS = int(os.getenv("CALENDAR_MAX_SPAN_DAYS", 186))
+# Days before and after today covered by the iCalendar feed
+ICS_FEED_PAST_DAYS = int(os.getenv("ICS_FEED_PAST_DAYS", 90))
+ICS_FEED_FUTURE_DAYS = int(os.getenv("ICS_FEED_FUTURE_DAYS", 365))
+ICS_FEED_NAME = os.getenv("ICS_FEED_NAME", "BWC Portal")
+
+ICS_MEDIA_TYPE = "text/calendar; charset=utf-8"
+
+def resolve_window(start: Optional[date], end: Optional[date]) -> tuple[date, date]:
+    """
+    Turns the optional start/end query parameters into an inclusive date window.
+    Missing bounds are filled in from CALENDAR_MAX_SPAN_DAYS (centered on today when
+    both are missing) and any wider window is capped to that span.
+    """
+    max_span = timedelta(days=CALENDAR_MAX_SPAN_DAYS)
+    if start is None and end is None:
+        start = date.today() - max_span // 2
+        end = start + max_span
+    elif start is None:
+        start = end - max_span
+    elif end is None:
+        end = start + max_span
+
+    if end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'end' must not be before 'start'.")
+    if end - start > max_span:
+        end = start + max_span
+    return start, end
+
+def _month_day(day: date) -> int:
+    return day.month * 100 + day.day
+
+def _birthday_in_year(birthday: date, year: int) -> date:
+    # 29 February birthdays are celebrated on 28 February in non-leap years
+    if birthday.month == 2 and birthday.day == 29 and not calendar_module.isleap(year):
+        return date(year, 2, 28)
+    return date(year, birthday.month, birthday.day)
+
+def birthday_window_filter(start: date, end: date):
+    """
+    Builds an indexed filter on User.birthday_month_day matching everyone whose
+    birthday falls inside [start, end]. Windows crossing a year boundary become two
+    ranges (start..31 Dec and 1 Jan..end); windows of a year or more match everyone.
+    """
+    if (end - start).days >= 365:
+        return User.birthday_month_day.isnot(None)
+
+    start_md, end_md = _month_day(start), _month_day(end)
+    # A window ending on 28 February of a non-leap year also covers 29 February birthdays
+    if end_md == 228 and not calendar_module.isleap(end.year):
+        end_md = 229
+
+    if start.year == end.year:
+        return User.birthday_month_day.between(start_md, end_md)
+    return or_(User.birthday_month_day >= start_md, User.birthday_month_day <= end_md)
+
+calendar_events_adapter = TypeAdapter(List[CalendarEvent])
+
+def _calendar_event(title: str, start, event_type: str, all_day: bool) -> dict:
+    # A CalendarEvent as a plain dict, with every field in schema order
+    return {
+        "title": title, "start": start, "end": start, "type": event_type, "allDay": all_day,
+        "user_id": None, "task_id": None, "group_id": None, "details": None,
+    }
+
+def render_calendar_events(events: list[dict]) -> bytes:
+    if FAST_JSON_ENABLED:
+        return dumps(events)
+    return calendar_events_adapter.dump_json(calendar_events_adapter.validate_python(events))
+
+async def build_calendar_events(db: AsyncSession, current_user: Principal, start: date, end: date) -> list[dict]:
+    """
+    Collects the birthdays, visible task deadlines and events inside [start, end] as
+    CalendarEvent dicts. Only the columns needed are selected, no ORM objects are built.
+    """
+    # Datetime columns are compared against the half-open range [start, end + 1 day)
+    window_start = datetime.combine(start, time.min)
+    window_end = datetime.combine(end + timedelta(days=1), time.min)
+
     events = []
 
     # 1. Fetch Birthdays
-    all_users = db.query(User).all()
-    for user in all_users:
-        if user.birthday:
-            birth_date_this_year = date(date.today().year, user.birthday.month, user.birthday.day)
-            events.append(
-                CalendarEvent(
-                    title=f"🎂 {user.first_name or user.email}'s Birthday",
-                    start=birth_date_this_year,
-                    end=birth_date_this_year,
-                    type="birthday",
-                    allDay=True
-                )
-            )
+    users_with_birthday = (await db.execute(
+        select(User.first_name, User.email, User.birthday).where(birthday_window_filter(start, end))
+    )).all()
+    for user in users_with_birthday:
+        for year in range(start.year, end.year + 1):
+            birthday = _birthday_in_year(user.birthday, year)
+            if not (start <= birthday <= end):
+                continue
+            events.append(_calendar_event(f"🎂 {user.first_name or user.email}'s Birthday", birthday, "birthday", True))
 
     # 2. Fetch Task Deadlines
-    tasks_query = db.query(Task)
-    if current_user.role == "admin":
-        tasks_to_include = tasks_query.all()
-    else:
-        user_group_ids = [group.id for group in current_user.groups]
-        tasks_to_include = db.query(Task).filter(
-            (Task.owner_id == current_user.id) | (Task.group_id.in_(user_group_ids))
-        ).all()
-
-    for task in tasks_to_include:
-        if task.deadline:
-            events.append(
-                CalendarEvent(
-                    title=f"✔️ Task: {task.title}",
-                    start=task.deadline,
-                    end=task.deadline,
-                    type="task",
-                    allDay=task.deadline_all_day
-                )
-            )
-            
-    # 3. Fetch Seminars/Events
-    all_events = db.query(Event).all()
-    for event in all_events:
-        events.append(
-            CalendarEvent(
-                title=f"🗓️ Event: {event.title}",
-                # --- THE FIX: Use the correct attribute 'event_date' ---
-                start=event.event_date,
-                end=event.event_date,
-                type="seminar",
-                allDay=False 
-            )
+    tasks_query = select(Task.title, Task.deadline, Task.deadline_all_day).where(
+        Task.deadline >= window_start,
+        Task.deadline < window_end
+    )
+    if current_user.role != "admin":
+        tasks_query = tasks_query.where(
+            (Task.owner_id == current_user.id) | (Task.group_id.in_(current_user.group_ids))
         )
 
+    for task in (await db.execute(tasks_query)).all():
+        events.append(_calendar_event(f"✔️ Task: {task.title}", task.deadline, "task", task.deadline_all_day))
+
+    # 3. Fetch Seminars/Events
+    window_events = (await db.execute(select(Event.title, Event.event_date).where(
+        Event.event_date >= window_start,
+        Event.event_date < window_end
+    ))).all()
+    for event in window_events:
+        # --- THE FIX: Use the correct attribute 'event_date' ---
+        events.append(_calendar_event(f"🗓️ Event: {event.title}", event.event_date, "seminar", False))
+
     return events
+
+@router.get("/events", response_model=List[CalendarEvent])
+@max_queries(5)
+async def get_calendar_events(
+    start: Optional[date] = Query(None, description="First day of the visible window (inclusive)"),
+    end: Optional[date] = Query(None, description="Last day of the visible window (inclusive)"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Returns the calendar for the visible window. Responses are cached per user and
+    carry an ETag; a matching If-None-Match header gets an empty 304 back.
+    """
+    start, end = resolve_window(start, end)
+    cache_key = (current_user.role, current_user.group_ids, start, end)
+
+    cached = calendar_cache.get(current_user.id, cache_key)
+    if cached is None:
+        generation = calendar_cache.generation
+        events = await build_calendar_events(db, current_user, start, end)
+        cached = calendar_cache.set(
+            current_user.id, current_user.role, cache_key,
+            render_calendar_events(events), generation
+        )
+
+    headers = {"ETag": cached.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+def feed_headers(etag: Optional[str], last_modified: datetime) -> dict:
+    headers = {"Last-Modified": format_datetime(last_modified, usegmt=True), "Cache-Control": "private, no-cache"}
+    if etag is not None:
+        headers["ETag"] = etag
+    return headers
+
+def feed_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], cached: CachedCalendar) -> bool:
+    # If-None-Match wins when a client sends both
+    if if_none_match:
+        return etag_matches(if_none_match, cached.etag)
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds
+    return cached.last_modified.replace(microsecond=0) <= since
+
+def feed_url(request: Request, token: str) -> dict:
+    return {"url": str(request.url_for("get_calendar_feed", token=token))}
+
+@router.get("/feed", response_model=dict)
+async def get_calendar_feed_url(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Returns the address of the current user's iCalendar feed, to subscribe to from
+    Outlook or a phone calendar. It is created on first use and works without logging
+    in, so it should be kept private; DELETE /calendar/feed revokes it.
+    """
+    token = await db.scalar(select(User.calendar_token).where(User.id == current_user.id))
+    if token is None:
+        # Only fills in a missing token, so concurrent first calls agree on one address
+        await db.execute(
+            update(User)
+            .where(User.id == current_user.id, User.calendar_token.is_(None))
+            .values(calendar_token=secrets.token_urlsafe(32))
+        )
+        await db.commit()
+        token = await db.scalar(select(User.calendar_token).where(User.id == current_user.id))
+    return feed_url(request, token)
+
+@router.delete("/feed", status_code=204)
+async def revoke_calendar_feed(db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    """
+    Invalidates the current user's feed address; GET /calendar/feed then issues a new one.
+    """
+    await db.execute(update(User).where(User.id == current_user.id).values(calendar_token=None))
+    await db.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.get("/feed/{token}.ics", name="get_calendar_feed")
+@max_queries(6)
+async def get_calendar_feed(
+    token: str,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    The birthdays, visible task deadlines and events of /calendar/events as an
+    iCalendar feed, from ICS_FEED_PAST_DAYS ago to ICS_FEED_FUTURE_DAYS ahead. The
+    token in the address identifies the user.
+
+    A freshly built feed is streamed as it is rendered and then cached until the data
+    behind it changes. Cached feeds carry an ETag and Last-Modified and answer
+    conditional requests with 304.
+    """
+    user_id = await db.scalar(select(User.id).where(User.calendar_token == token))
+    principal = None if user_id is None else principal_cache.get(user_id) or await load_principal(db, user_id)
+    if principal is None or not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calendar feed not found")
+
+    today = date.today()
+    start, end = today - timedelta(days=ICS_FEED_PAST_DAYS), today + timedelta(days=ICS_FEED_FUTURE_DAYS)
+    cache_key = ("ics", principal.role, principal.group_ids, start, end)
+
+    cached = calendar_cache.get(principal.id, cache_key)
+    if cached is not None:
+        headers = feed_headers(cached.etag, cached.last_modified)
+        if feed_not_modified(if_none_match, if_modified_since, cached):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=cached.body, media_type=ICS_MEDIA_TYPE, headers=headers)
+
+    generation = calendar_cache.generation
+    # Taken before reading, so a change made while we read gets a later Last-Modified
+    read_at = datetime.now(timezone.utc)
+    events = await build_calendar_events(db, principal, start, end)
+
+    def chunks():
+        rendered = []
+        for chunk in render_calendar(events, ICS_FEED_NAME):
+            rendered.append(chunk)
+            yield chunk
+        calendar_cache.set(principal.id, principal.role, cache_key, b"".join(rendered), generation, read_at)
+
+    # The ETag is only known once the whole body is rendered, so this response has none
+    return StreamingResponse(chunks(), media_type=ICS_MEDIA_TYPE, headers=feed_headers(None, read_at))
@@ -1,85 +1,245 @@
 # routers/companies.py
-from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy.orm import Session
+import csv
+import io
+import json
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 import models
 import schemas
-from database import get_db
+from database import get_async_db
+from utils.principal_cache import Principal
+from utils.query_recorder import batched_queries
+from utils.task_stats import forget_task_stats
 from .auth import get_current_user
 from .utils import check_roles
+from .pagination import PageParams, page_params, paginate
 
 router = APIRouter(prefix="/companies", tags=["companies"])
 
+# Largest number of companies accepted by one POST /companies/bulk request
+COMPANY_BULK_MAX_ITEMS = int(os.getenv("COMPANY_BULK_MAX_ITEMS", 10000))
+# Names / VAT numbers looked up per uniqueness query, well below the databases' bind parameter limits
+UNIQUENESS_CHECK_CHUNK = 5000
+
+COMPANY_FIELDS = list(schemas.CompanyCreate.model_fields)
+
+def parse_company_csv(text: str) -> list[dict]:
+    """
+    Reads companies from CSV with a header row naming the columns (name, vat_number,
+    occupation, creation_date, description; only name is required). Empty cells are
+    missing values and unknown columns are ignored. Raises ValueError without a name column.
+    """
+    reader = csv.DictReader(io.StringIO(text.removeprefix("\ufeff")))
+    if not reader.fieldnames or "name" not in [field.strip() for field in reader.fieldnames]:
+        raise ValueError("The CSV needs a header row with at least a 'name' column.")
+    return [
+        {key.strip(): value.strip() or None for key, value in row.items() if key and key.strip() in COMPANY_FIELDS and value is not None}
+        for row in reader
+    ]
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, item['loc'])) or 'row'}: {item['msg']}" for item in error.errors())
+
+async def _taken_names_and_vats(db: AsyncSession, names: list[str], vats: list[str]) -> tuple[set, set]:
+    """
+    Returns which of the names and VAT numbers existing companies already use, with one
+    set-based query (per UNIQUENESS_CHECK_CHUNK values) instead of two per company.
+    """
+    taken_names, taken_vats = set(), set()
+    for offset in range(0, max(len(names), len(vats)), UNIQUENESS_CHECK_CHUNK):
+        chunk_names = names[offset:offset + UNIQUENESS_CHECK_CHUNK]
+        chunk_vats = vats[offset:offset + UNIQUENESS_CHECK_CHUNK]
+        rows = (await db.execute(
+            select(models.Company.name, models.Company.vat_number)
+            .where(or_(models.Company.name.in_(chunk_names), models.Company.vat_number.in_(chunk_vats)))
+        )).all()
+        taken_names.update(name for name, _ in rows)
+        taken_vats.update(vat for _, vat in rows if vat)
+    return taken_names, taken_vats
+
+async def import_companies(db: AsyncSession, items: list, dry_run: bool = False) -> schemas.CompanyBulkResponse:
+    """
+    Validates every item, checks names and VAT numbers against the existing companies
+    and against the other items in one pass, and inserts the valid ones with a single
+    multi-row INSERT ... RETURNING. Invalid items are reported, the rest are saved.
+    """
+    results, candidates = [], []
+    for index, item in enumerate(items):
+        try:
+            candidates.append((index, schemas.CompanyCreate.model_validate(item)))
+        except ValidationError as error:
+            results.append(schemas.CompanyBulkResult(
+                index=index, status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=_validation_detail(error)
+            ))
+
+    taken_names, taken_vats = await _taken_names_and_vats(
+        db,
+        sorted({company.name for _, company in candidates}),
+        sorted({company.vat_number for _, company in candidates if company.vat_number}),
+    )
+
+    accepted, seen_names, seen_vats = [], set(), set()
+    for index, company in candidates:
+        if company.name in taken_names:
+            detail = "A company with this name already exists."
+        elif company.vat_number and company.vat_number in taken_vats:
+            detail = "A company with this VAT number already exists."
+        elif company.name in seen_names:
+            detail = "This name appears earlier in the import."
+        elif company.vat_number and company.vat_number in seen_vats:
+            detail = "This VAT number appears earlier in the import."
+        else:
+            seen_names.add(company.name)
+            if company.vat_number:
+                seen_vats.add(company.vat_number)
+            accepted.append((index, company))
+            continue
+        results.append(schemas.CompanyBulkResult(index=index, status_code=status.HTTP_400_BAD_REQUEST, detail=detail))
+
+    ids_by_name = {}
+    if accepted and not dry_run:
+        try:
+            # Accepted names are unique, so ids are matched by name rather than by asking
+            # for RETURNING in parameter order, which splits the batch into one INSERT per row
+            ids_by_name = {name: company_id for company_id, name in (await db.execute(
+                insert(models.Company).returning(models.Company.id, models.Company.name),
+                [company.model_dump() for _, company in accepted],
+            )).all()}
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Some of these companies were created by someone else meanwhile; run the import again.",
+            )
+    results.extend(
+        schemas.CompanyBulkResult(index=index, id=ids_by_name.get(company.name), status_code=status.HTTP_201_CREATED)
+        for index, company in accepted
+    )
+
+    results.sort(key=lambda result: result.index)
+    return schemas.CompanyBulkResponse(
+        created=len(accepted), failed=len(results) - len(accepted), dry_run=dry_run, results=results
+    )
+
 @router.post("/", response_model=schemas.CompanyOut, status_code=status.HTTP_201_CREATED)
-def create_company(
+async def create_company(
     company: schemas.CompanyCreate, 
-    db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: Principal = Depends(get_current_user)
 ):
     check_roles(current_user, ["admin"])
 
     # --- MODIFIED: Only check for VAT uniqueness if it's provided ---
     if company.vat_number:
-        db_company_vat = db.query(models.Company).filter(models.Company.vat_number == company.vat_number).first()
+        db_company_vat = await db.scalar(select(models.Company).where(models.Company.vat_number == company.vat_number))
         if db_company_vat:
             raise HTTPException(status_code=400, detail="A company with this VAT number already exists.")
     
-    db_company_name = db.query(models.Company).filter(models.Company.name == company.name).first()
+    db_company_name = await db.scalar(select(models.Company).where(models.Company.name == company.name))
     if db_company_name:
         raise HTTPException(status_code=400, detail="A company with this name already exists.")
 
     new_company = models.Company(**company.dict())
     db.add(new_company)
-    db.commit()
-    db.refresh(new_company)
+    await db.commit()
+    await db.refresh(new_company)
     return new_company
 
+@router.post("/bulk", response_model=schemas.CompanyBulkResponse)
+@batched_queries
+async def create_companies_bulk(
+    request: Request,
+    dry_run: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Imports many companies at once, from JSON ({"items": [company, ...]}) or from CSV
+    sent with Content-Type: text/csv. Returns a result per item, with the reason for
+    every rejected one. With dry_run=true nothing is saved.
+    """
+    check_roles(current_user, ["admin"])
+
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        if content_type == "text/csv":
+            items = parse_company_csv(body.decode("utf-8"))
+        else:
+            payload = json.loads(body)
+            items = payload.get("items") if isinstance(payload, dict) else None
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not read the request body.")
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Send {"items": [...]} as JSON, or CSV with Content-Type: text/csv.'
+        )
+
+    if len(items) > COMPANY_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A bulk request may contain at most {COMPANY_BULK_MAX_ITEMS} items."
+        )
+    return await import_companies(db, items, dry_run)
+
 # ... (The rest of the file: list_companies, get_company, delete_company, etc. remains the same) ...
 
 @router.get("/", response_model=List[schemas.CompanyOut])
-def list_companies(
-    db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+async def list_companies(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: Principal = Depends(get_current_user)
 ):
     """
-    Returns a list of all companies.
+    Returns a page of companies in id order.
     """
-    return db.query(models.Company).all()
+    return await paginate(db, select(models.Company), [models.Company.id], page, response)
 
 @router.get("/{company_id}", response_model=schemas.CompanyOut)
-def get_company(
+async def get_company(
     company_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Returns details of a specific company.
     """
-    company = db.query(models.Company).filter(models.Company.id == company_id).first()
+    company = await db.scalar(select(models.Company).where(models.Company.id == company_id))
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
     return company
 
 @router.delete("/{company_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_company(
+async def delete_company(
     company_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Deletes a company after unlinking any associated tasks.
     """
     check_roles(current_user, ["admin"])
     
-    company = db.query(models.Company).filter(models.Company.id == company_id).first()
+    company = await db.scalar(select(models.Company).where(models.Company.id == company_id))
     if not company:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Company not found")
     
-    db.query(models.Task).filter(models.Task.company_id == company_id).update({"company_id": None})
-    db.commit()
+    await db.execute(update(models.Task).where(models.Task.company_id == company_id).values(company_id=None))
+    await forget_task_stats(db, "company", company_id)
+    await db.commit()
     
-    db.delete(company)
-    db.commit()
+    await db.delete(company)
+    await db.commit()
     
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,19 +1,22 @@
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from database import get_db
-from models import User, Task, Group
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from models import Task
+from utils.principal_cache import Principal
 from .auth import get_current_user
+from .utils import is_group_member_cached
 
-def get_task_for_update(
+async def get_task_for_update(
     task_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ) -> Task:
     """
     Fetches a task by its ID and verifies if the current user has permission to update it.
     Raises HTTPException if the task is not found or the user is not authorized.
     """
-    task = db.query(Task).filter(Task.id == task_id).first()
+    task = await db.scalar(select(Task).where(Task.id == task_id))
     if not task:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
 
@@ -25,11 +28,9 @@ def get_task_for_update(
         return task
 
     # Check if the user is a member of the task's group
-    if task.group_id:
-        group = db.query(Group).filter(Group.id == task.group_id).first()
-        if group and current_user in group.members:
-            # Grant access for group members, but the route handler will check which fields they can update
-            return task
+    if task.group_id and is_group_member_cached(current_user, task.group_id):
+        # Grant access for group members, but the route handler will check which fields they can update
+        return task
             
     # If none of the above conditions are met, deny access
     raise HTTPException(
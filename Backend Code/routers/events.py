@@ -1,39 +1,52 @@
 # routers/events.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime, timezone
 
 import models, schemas
-from database import get_db
+from database import get_async_db
+from utils.principal_cache import Principal
 from .auth import get_current_user
 from .utils import check_roles
+from .pagination import PageParams, page_params, paginate
+from utils.calendar_cache import calendar_cache
+from utils.realtime import everyone, realtime_broker
 
 router = APIRouter(prefix="/events", tags=["events"])
 
 @router.post("/", response_model=schemas.EventOut, status_code=status.HTTP_201_CREATED)
-def create_event(event: schemas.EventCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def create_event(event: schemas.EventCreate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     """
     Creates a new event. Admin only.
     """
     check_roles(current_user, ["admin"])
     new_event = models.Event(**event.dict(), created_by_id=current_user.id)
     db.add(new_event)
-    db.commit()
-    db.refresh(new_event)
+    await db.commit()
+    await db.refresh(new_event)
+    calendar_cache.invalidate_all()
+    await realtime_broker.publish("event.created", everyone(), event_id=new_event.id)
     return new_event
 
 @router.get("/upcoming", response_model=Optional[schemas.EventOut])
-def get_upcoming_event(db: Session = Depends(get_db)):
+async def get_upcoming_event(db: AsyncSession = Depends(get_async_db)):
     """
     Gets the single next upcoming event. Returns null if no future events exist.
     """
-    upcoming_event = db.query(models.Event).filter(models.Event.event_date >= datetime.now(timezone.utc)).order_by(models.Event.event_date.asc()).first()
+    upcoming_event = await db.scalar(select(models.Event).where(models.Event.event_date >= datetime.now(timezone.utc)).order_by(models.Event.event_date.asc()))
     return upcoming_event
 
 @router.get("/", response_model=List[schemas.EventOut])
-def list_all_events(db: Session = Depends(get_db)):
+async def list_all_events(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Returns a list of all events, ordered by date.
+    Returns a page of events, newest first.
     """
-    return db.query(models.Event).order_by(models.Event.event_date.desc()).all()
\ No newline at end of file
+    return await paginate(
+        db, select(models.Event), [models.Event.event_date, models.Event.id], page, response, descending=True
+    )
\ No newline at end of file
@@ -0,0 +1,119 @@
+# routers/exports.py
+import csv
+import io
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from database import session_scope
+from models import Company, Task, User
+from schemas import CompanyOut
+from utils.fast_json import dumps, schema_columns
+from utils.principal_cache import Principal
+from .auth import USER_COLUMNS, get_current_user
+from .tasks import TASK_COLUMNS, visible_to
+from .utils import check_roles
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+# Rows fetched from the server-side cursor, encoded and sent per chunk. Memory use
+# depends on this, not on the size of the export.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+COMPANY_COLUMNS = schema_columns(CompanyOut, Company)
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def _csv_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def encode_csv(columns: list[str], rows, header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+def encode_ndjson(columns: list[str], rows) -> bytes:
+    return b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+def export_response(name: str, query, export_format: str) -> StreamingResponse:
+    """
+    Streams the rows of a column query as CSV (with a header line) or newline-delimited
+    JSON. The rows are read in EXPORT_BATCH_SIZE partitions from a server-side cursor on
+    a session of the response's own, held only while the body is being sent.
+    """
+    columns = [column.key for column in query.selected_columns]
+
+    async def chunks():
+        if export_format == "csv":
+            # Sent even when there are no rows, so the file always has its header
+            yield encode_csv(columns, [], header=True)
+        async with session_scope() as db:
+            result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for rows in result.partitions():
+                if export_format == "csv":
+                    yield encode_csv(columns, rows, header=False)
+                else:
+                    yield encode_ndjson(columns, rows)
+
+    filename = f"{name}-{date.today():%Y%m%d}.{export_format}"
+    return StreamingResponse(
+        chunks(),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"},
+    )
+
+format_query = Query("csv", alias="format", pattern="^(csv|ndjson)$")
+
+@router.get("/tasks")
+async def export_tasks(
+    export_format: str = format_query,
+    company_id: Optional[int] = None,
+    group_id: Optional[int] = None,
+    status: Optional[str] = None,
+    deadline_from: Optional[date] = Query(None, description="Tasks due on or after this day"),
+    deadline_to: Optional[date] = Query(None, description="Tasks due on or before this day"),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Streams the tasks the current user can see, in id order, as CSV or NDJSON, optionally
+    filtered by company, group, status and deadline days.
+    """
+    query = select(*TASK_COLUMNS).order_by(Task.id)
+    visibility = visible_to(current_user, Task.owner_id, Task.group_id)
+    if visibility is not None:
+        query = query.where(visibility)
+    if company_id is not None:
+        query = query.where(Task.company_id == company_id)
+    if group_id is not None:
+        query = query.where(Task.group_id == group_id)
+    if status is not None:
+        query = query.where(Task.status == status)
+    if deadline_from is not None:
+        query = query.where(Task.deadline >= datetime.combine(deadline_from, time.min))
+    if deadline_to is not None:
+        query = query.where(Task.deadline < datetime.combine(deadline_to + timedelta(days=1), time.min))
+    return export_response("tasks", query, export_format)
+
+@router.get("/users")
+async def export_users(export_format: str = format_query, current_user: Principal = Depends(get_current_user)):
+    """
+    Streams every user (without password hashes), in id order. Admin only.
+    """
+    check_roles(current_user, ["admin"])
+    return export_response("users", select(*USER_COLUMNS).order_by(User.id), export_format)
+
+@router.get("/companies")
+async def export_companies(export_format: str = format_query, current_user: Principal = Depends(get_current_user)):
+    """
+    Streams every company, in id order.
+    """
+    return export_response("companies", select(*COMPANY_COLUMNS).order_by(Company.id), export_format)
@@ -1,75 +1,98 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy.orm import Session
-from database import get_db
-from models import Group, User, Task  # Ensure User and Task are imported
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from models import Group, User, Task, group_members  # Ensure User and Task are imported
 from schemas import GroupCreate, GroupOut, UserResponse, GroupTaskCreate, TaskResponse, TaskCreate
-from .auth import get_current_user
-from .utils import check_roles, is_admin_or_owner, is_admin_or_group_member
+from utils.principal_cache import Principal, principal_cache
+from .auth import USER_COLUMNS, get_current_user, user_response_rows
+from .tasks import TASK_COLUMNS
+from .utils import check_roles, is_admin_or_owner, is_admin_or_group_member, is_group_member, mark_visibility_changed
+from .pagination import PageParams, page_params, paginate_rows
+from utils.calendar_cache import calendar_cache, invalidate_task_viewers
+from utils.fast_json import fast_json_response
+from utils.query_recorder import max_queries
+from utils.realtime import group_audience, realtime_broker, task_audience
+from utils.task_stats import forget_task_stats, task_stat_keys, update_task_stats
 
 router = APIRouter(prefix="/groups", tags=["groups"])
 
 @router.get("/", response_model=list[GroupOut])
-def list_groups(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def list_groups(db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     if current_user.role == "admin":
-        return db.query(Group).all()
+        return (await db.scalars(select(Group))).all()
     else:
-        return current_user.groups
+        return (await db.scalars(select(Group).where(Group.id.in_(current_user.group_ids)))).all()
 
 @router.post("/{group_id}/add-user/{user_id}")
-def add_user_to_group(group_id: int, user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    group = db.query(Group).filter(Group.id == group_id).first()
+async def add_user_to_group(group_id: int, user_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    group = await db.scalar(select(Group).where(Group.id == group_id))
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
     check_roles(current_user, ["admin"])
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if user in group.members:
+    if await is_group_member(db, group_id, user_id):
         raise HTTPException(status_code=400, detail="User already in group")
 
-    group.members.append(user)
-    db.commit()
+    try:
+        await db.execute(insert(group_members).values(group_id=group_id, user_id=user_id))
+        await mark_visibility_changed(db, [user_id])
+        await db.commit()
+    except IntegrityError:
+        # Added by a concurrent request since the check above
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="User already in group")
+    calendar_cache.invalidate_users([user.id], include_admins=False)
+    principal_cache.invalidate([user.id])
+    await realtime_broker.publish("group.member_added", group_audience(group_id, [user.id]), group_id=group_id, user_id=user.id)
     return {"message": f"User {user.email} added to group {group.name}"}
 
 @router.post("/", response_model=GroupOut)
-def create_group(group: GroupCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_group(group: GroupCreate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     check_roles(current_user, ["admin"])
 
-    existing = db.query(Group).filter(Group.name == group.name).first()
+    existing = await db.scalar(select(Group).where(Group.name == group.name))
     if existing:
         raise HTTPException(status_code=400, detail="Group already exists")
 
-    new_group = Group(name=group.name)
+    creator = await db.scalar(select(User).where(User.id == current_user.id))
+    new_group = Group(name=group.name, members=[creator])
     db.add(new_group)
-    db.commit()
-    db.refresh(new_group)
-
-    new_group.members.append(current_user)
-    db.commit()
-    db.refresh(new_group)
+    await db.commit()
+    await db.refresh(new_group)
+    principal_cache.invalidate([current_user.id])
 
     return new_group
 
 @router.get("/{group_id}/members", response_model=list[UserResponse])
-def get_group_members(group_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    group = db.query(Group).filter(Group.id == group_id).first()
+@max_queries(4)
+async def get_group_members(group_id: int, response: Response, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    group = await db.scalar(select(Group).where(Group.id == group_id))
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    if not is_admin_or_group_member(current_user, group.members):
+    if not is_admin_or_group_member(current_user, group_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view members of this group.")
 
-    return group.members
+    rows = (await db.execute(
+        select(*USER_COLUMNS)
+        .join(group_members, group_members.c.user_id == User.id)
+        .where(group_members.c.group_id == group_id)
+    )).all()
+    return fast_json_response(user_response_rows([row._asdict() for row in rows]), response)
 
 @router.get("/{group_id}", response_model=GroupOut)
-def get_group_by_id(group_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    group = db.query(Group).filter(Group.id == group_id).first()
+async def get_group_by_id(group_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    group = await db.scalar(select(Group).where(Group.id == group_id))
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    if not is_admin_or_group_member(current_user, group.members):
+    if not is_admin_or_group_member(current_user, group_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to view this group's details (only admin or member)."
@@ -77,8 +100,8 @@ def get_group_by_id(group_id: int, db: Session = Depends(get_db), current_user:
     return group
 
 @router.post("/{group_id}/assign-task", response_model=TaskResponse)
-def create_group_task(group_id: int, task: GroupTaskCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    group = db.query(Group).filter(Group.id == group_id).first()
+async def create_group_task(group_id: int, task: GroupTaskCreate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    group = await db.scalar(select(Group).where(Group.id == group_id))
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
@@ -98,45 +121,66 @@ def create_group_task(group_id: int, task: GroupTaskCreate, db: Session = Depend
         group_id=group_id
     )
     db.add(new_task)
-    db.commit()
-    db.refresh(new_task)
+    await update_task_stats(db, [], task_stat_keys(new_task))
+    await db.commit()
+    await db.refresh(new_task)
+    if new_task.deadline:
+        await invalidate_task_viewers(db, new_task.owner_id, group_id)
+    await realtime_broker.publish("task.created", task_audience(new_task.owner_id, group_id), task_id=new_task.id)
     return new_task
 
 @router.get("/{group_id}/tasks", response_model=list[TaskResponse])
-def get_group_tasks(group_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    group = db.query(Group).filter(Group.id == group_id).first()
+@max_queries(4)
+async def get_group_tasks(
+    group_id: int,
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    group = await db.scalar(select(Group).where(Group.id == group_id))
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
 
-    if not is_admin_or_group_member(current_user, group.members):
+    if not is_admin_or_group_member(current_user, group_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view tasks of this group.")
 
-    return db.query(Task).filter(Task.group_id == group_id).all()
+    rows = await paginate_rows(db, select(*TASK_COLUMNS).where(Task.group_id == group_id), [Task.id], page, response)
+    return fast_json_response(rows, response)
 
 @router.delete("/{group_id}", status_code=204)
-def delete_group(group_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def delete_group(group_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     check_roles(current_user, ["admin"])
 
-    group = db.query(Group).filter(Group.id == group_id).first()
+    group = await db.scalar(select(Group).where(Group.id == group_id))
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
-    db.delete(group)
-    db.commit()
+    member_ids = (await db.scalars(
+        select(group_members.c.user_id).where(group_members.c.group_id == group_id)
+    )).all()
+    await db.execute(delete(group_members).where(group_members.c.group_id == group_id))
+    await forget_task_stats(db, "group", group_id)
+    await mark_visibility_changed(db, member_ids)
+    await db.delete(group)
+    await db.commit()
+    calendar_cache.invalidate_users(member_ids)
+    principal_cache.invalidate(member_ids)
+    await realtime_broker.publish("group.deleted", group_audience(group_id, member_ids), group_id=group_id, user_ids=list(member_ids))
     return Response(status_code=204)
 
 @router.delete("/{group_id}/remove-user/{user_id}")
-def remove_user_from_group(group_id: int, user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    group = db.query(Group).filter(Group.id == group_id).first()
-    user_to_remove = db.query(User).filter(User.id == user_id).first()
+async def remove_user_from_group(group_id: int, user_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    group = await db.scalar(select(Group).where(Group.id == group_id))
+    user_to_remove = await db.scalar(select(User).where(User.id == user_id))
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     if not user_to_remove:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not current_user.role == "admin" and current_user not in group.members:
+    if not is_admin_or_group_member(current_user, group_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to remove members from this group.")
 
-    if user_to_remove not in group.members:
+    if not await is_group_member(db, group_id, user_id):
         raise HTTPException(status_code=400, detail="User is not a member of this group")
 
     if not current_user.role == "admin":
@@ -145,6 +189,15 @@ def remove_user_from_group(group_id: int, user_id: int, db: Session = Depends(ge
         if user_to_remove.role == "admin":
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only an admin can remove another admin.")
 
-    group.members.remove(user_to_remove)
-    db.commit()
+    await db.execute(delete(group_members).where(
+        group_members.c.group_id == group_id,
+        group_members.c.user_id == user_id
+    ))
+    await mark_visibility_changed(db, [user_id])
+    await db.commit()
+    calendar_cache.invalidate_users([user_to_remove.id], include_admins=False)
+    principal_cache.invalidate([user_to_remove.id])
+    await realtime_broker.publish(
+        "group.member_removed", group_audience(group_id, [user_to_remove.id]), group_id=group_id, user_id=user_to_remove.id
+    )
     return {"message": f"User {user_to_remove.email} removed from group {group.name}"}
\ No newline at end of file
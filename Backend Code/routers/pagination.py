@@ -0,0 +1,97 @@
+# routers/pagination.py
+import base64
+import json
+import os
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import HTTPException, Query, Response, status
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 100))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 500))
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+@dataclass
+class PageParams:
+    limit: int
+    cursor: Optional[str]
+
+
+def page_params(
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Maximum number of items to return"),
+    cursor: Optional[str] = Query(None, description=f"Opaque cursor taken from the {NEXT_CURSOR_HEADER} response header"),
+) -> PageParams:
+    return PageParams(limit=limit, cursor=cursor)
+
+
+def encode_cursor(values: list) -> str:
+    payload = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    """
+    Turns a cursor back into one value per sort column, converting dates back to the
+    column's Python type. Malformed cursors are rejected with 400.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match the sort order")
+        decoded = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            decoded.append(value)
+        return decoded
+    except (ValueError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor.")
+
+
+def _page_query(query, order_by: list, page: PageParams, descending: bool):
+    if page.cursor:
+        after = decode_cursor(page.cursor, order_by)
+        keys, values = tuple_(*order_by), tuple_(*after)
+        query = query.where(keys < values if descending else keys > values)
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in order_by])
+    # One row more than requested tells whether there is a next page
+    return query.limit(page.limit + 1)
+
+
+def _trim_page(items: list, order_by: list, page: PageParams, response: Response) -> list:
+    if len(items) > page.limit:
+        items = items[:page.limit]
+        last = items[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(last, column.key) for column in order_by])
+    return items
+
+
+async def paginate(db: AsyncSession, query, order_by: list, page: PageParams, response: Response, descending: bool = False) -> list:
+    """
+    Runs a keyset-paginated query. `order_by` lists the sort columns, ending with a
+    unique one (usually the primary key) so the order is stable. The page starts right
+    after the row encoded in the cursor, so deep pages cost the same as the first one.
+    The cursor for the following page is returned in the X-Next-Cursor header.
+    """
+    items = (await db.scalars(_page_query(query, order_by, page, descending))).all()
+    return _trim_page(items, order_by, page, response)
+
+
+async def paginate_rows(db: AsyncSession, query, order_by: list, page: PageParams, response: Response, descending: bool = False) -> list[dict]:
+    """
+    Same as paginate() for a select of plain columns (which must include the sort
+    columns), returning each row as a dict without building ORM objects.
+    """
+    rows = (await db.execute(_page_query(query, order_by, page, descending))).all()
+    return [row._asdict() for row in _trim_page(rows, order_by, page, response)]
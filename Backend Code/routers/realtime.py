@@ -0,0 +1,153 @@
+# routers/realtime.py
+import asyncio
+import json
+import os
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from database import session_scope
+from utils.principal_cache import Principal, principal_cache
+from utils.realtime import realtime_broker
+from .auth import create_access_token, decode_token, get_current_user, load_principal, oauth2_scheme
+from .utils import check_roles
+
+router = APIRouter(prefix="/realtime", tags=["realtime"])
+
+# Seconds between keep-alive comments on an idle stream (keeps proxies from closing it)
+REALTIME_KEEPALIVE_SECONDS = float(os.getenv("REALTIME_KEEPALIVE_SECONDS", 15))
+# Lifetime of the tickets EventSource clients put in the stream URL instead of their
+# access token, so URLs that end up in access logs are only usable for this long
+REALTIME_TICKET_SECONDS = int(os.getenv("REALTIME_TICKET_SECONDS", 60))
+
+STREAM_TICKET_PURPOSE = "realtime-stream"
+
+def format_event(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def current_principal(user_id: int) -> Optional[Principal]:
+    # The session is closed straight away so an open stream does not hold a database connection
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        async with session_scope() as db:
+            principal = await load_principal(db, user_id)
+    return principal
+
+async def authenticate_stream(ticket: Optional[str], authorization: Optional[str]) -> tuple[Principal, datetime]:
+    """
+    Resolves the caller of a stream and when their session ends. Browsers' EventSource
+    cannot send headers, so it passes a ticket from POST /realtime/ticket instead of
+    the access token; other clients may send the usual Authorization header.
+    """
+    unauthorized = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if ticket is not None:
+        claims = decode_token(ticket)
+        if claims.get("purpose") != STREAM_TICKET_PURPOSE:
+            raise unauthorized
+        session_expires_at = claims.get("session_exp")
+    elif authorization and authorization.lower().startswith("bearer "):
+        claims = decode_token(authorization[len("bearer "):])
+        if claims.get("purpose") is not None:
+            raise unauthorized
+        session_expires_at = claims.get("exp")
+    else:
+        raise unauthorized
+    if claims.get("id") is None or session_expires_at is None:
+        raise unauthorized
+
+    principal = await current_principal(claims["id"])
+    if principal is None:
+        raise unauthorized
+    if not principal.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="This account has been deactivated.")
+    return principal, datetime.fromtimestamp(session_expires_at, timezone.utc)
+
+@router.post("/ticket", response_model=dict)
+async def create_stream_ticket(token: str = Depends(oauth2_scheme), current_user: Principal = Depends(get_current_user)):
+    """
+    Issues a ticket for GET /realtime/stream?ticket=..., valid for REALTIME_TICKET_SECONDS
+    and only for opening the stream. The stream it opens still ends when the access
+    token expires.
+    """
+    session_expires_at = decode_token(token)["exp"]
+    ticket = create_access_token(
+        data={"id": current_user.id, "purpose": STREAM_TICKET_PURPOSE, "session_exp": session_expires_at},
+        expires_delta=timedelta(seconds=REALTIME_TICKET_SECONDS),
+    )
+    return {"ticket": ticket, "expires_in": REALTIME_TICKET_SECONDS}
+
+@router.get("/stream")
+async def stream_changes(
+    request: Request,
+    ticket: Optional[str] = Query(None, description="From POST /realtime/ticket, for clients that cannot set headers"),
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events stream of the changes the current user can see: task.created,
+    task.updated, task.deleted, group.member_added, group.member_removed, group.deleted
+    and event.created. Messages carry ids only; clients
+    fetch the data with GET /tasks/changes or the calendar. A 'resync' event means
+    messages were dropped and everything should be refetched.
+
+    The caller's role and status are checked again every REALTIME_KEEPALIVE_SECONDS.
+    The stream ends with a 'closed' event when the access token expires
+    (reason 'session_expired') or the account is deactivated or deleted
+    ('access_revoked'); clients should not reconnect without signing in again.
+    """
+    principal, session_expires_at = await authenticate_stream(ticket, authorization)
+    subscription = realtime_broker.subscribe(principal)
+
+    async def events():
+        try:
+            # Ask EventSource to reconnect after 5 seconds if the stream drops
+            yield "retry: 5000\n\n"
+            next_check = time.monotonic() + REALTIME_KEEPALIVE_SECONDS
+            while not await request.is_disconnected():
+                remaining = (session_expires_at - datetime.now(timezone.utc)).total_seconds()
+                if remaining <= 0:
+                    yield format_event("closed", {"reason": "session_expired"})
+                    return
+                if time.monotonic() >= next_check:
+                    next_check = time.monotonic() + REALTIME_KEEPALIVE_SECONDS
+                    current = await current_principal(subscription.principal.id)
+                    if current is None or not current.is_active:
+                        yield format_event("closed", {"reason": "access_revoked"})
+                        return
+                    # Group ids are kept from the membership messages, which may be more
+                    # recent than this worker's principal cache
+                    subscription.principal = replace(subscription.principal, role=current.role)
+                if subscription.overflowed:
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.overflowed = False
+                    yield format_event("resync", {})
+                    continue
+                wait = min(remaining, max(next_check - time.monotonic(), 0))
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), wait)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(message["type"], message["data"])
+        finally:
+            realtime_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/stats", response_model=dict)
+async def get_realtime_stats(current_user: Principal = Depends(get_current_user)):
+    """
+    Returns the fan-out backend in use, connected subscribers and message counters. Admin only.
+    """
+    check_roles(current_user, ["admin"])
+    return realtime_broker.stats()
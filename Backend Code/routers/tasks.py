@@ -1,51 +1,383 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, status
-from sqlalchemy.orm import Session
-from database import get_db
-from models import Task, User, Group
-from schemas import TaskCreate, TaskResponse, TaskUpdate
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from models import Company, Task, TaskTombstone, User, Group
+from schemas import (
+    TaskBulkCreate, TaskBulkDelete, TaskBulkResponse, TaskBulkResult, TaskBulkUpdate,
+    TaskChanges, TaskCreate, TaskResponse, TaskStats, TaskUpdate,
+)
+from utils.calendar_cache import invalidate_task_viewers, invalidate_tasks_viewers
+from utils.fast_json import fast_json_response, schema_columns
+from utils.principal_cache import Principal
+from utils.query_recorder import max_queries
+from utils.realtime import realtime_broker, task_audience
+from utils.task_stats import empty_summary, summarize_task_stats, task_stat_keys, update_task_stats
 from .auth import get_current_user
-from .utils import check_roles
+from .utils import check_roles, is_group_member_cached
 from .dependencies import get_task_for_update  # --- NEW: Import the dependency ---
+from .pagination import PageParams, page_params, paginate, paginate_rows
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
+# Each /tasks/changes response hands back a high-water mark this many seconds in the
+# past, so rows committed by transactions that were still running are picked up on
+# the next poll (clients may see a task twice and should upsert by id). updated_at is
+# stamped when a row is written, not when its transaction commits, so a transaction
+# committing more than this long after writing a task can be missed by a poll made in
+# between; raise it if bulk writes on a busy database take longer.
+TASK_CHANGES_OVERLAP_SECONDS = float(os.getenv("TASK_CHANGES_OVERLAP_SECONDS", 5))
+# Deleted tasks are remembered this long; older 'since' values need a full resync
+TASK_TOMBSTONE_RETENTION_DAYS = int(os.getenv("TASK_TOMBSTONE_RETENTION_DAYS", 30))
+# Columns of a TaskResponse, selected as plain tuples by the fast list endpoints
+TASK_COLUMNS = schema_columns(TaskResponse, Task)
+# Largest number of items accepted by one bulk request
+TASK_BULK_MAX_ITEMS = int(os.getenv("TASK_BULK_MAX_ITEMS", 500))
+
+# The only fields group members may change on a task they do not own
+MEMBER_UPDATABLE_FIELDS = {"status", "completed"}
+
+def visible_to(current_user: Principal, owner_column, group_column):
+    """
+    Filter for rows a non-admin may see: their own tasks and those of their groups.
+    Returns None for admins, who see everything.
+    """
+    if current_user.role == "admin":
+        return None
+    return (owner_column == current_user.id) | (group_column.in_(current_user.group_ids))
+
+def apply_task_update(task: Task, update_data: dict):
+    for field, value in update_data.items():
+        setattr(task, field, value)
+
+    # Handle the logic where status and completed are linked
+    if "completed" in update_data:
+        task.status = "completed" if task.completed else "new"
+    elif "status" in update_data:
+        task.completed = task.status == "completed"
+
+async def record_deletions(db: AsyncSession, tasks: list[Task]):
+    """
+    Leaves a tombstone for each deleted task (for GET /tasks/changes) and drops the
+    tombstones no client can still ask about.
+    """
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        TaskTombstone(task_id=task.id, owner_id=task.owner_id, group_id=task.group_id, deleted_at=now)
+        for task in tasks
+    ])
+    await db.execute(delete(TaskTombstone).where(
+        TaskTombstone.deleted_at < now - timedelta(days=TASK_TOMBSTONE_RETENTION_DAYS)
+    ))
+
+async def publish_task_changes(event_type: str, tasks: list[Task]):
+    """
+    Pushes task.created / task.updated / task.deleted to the users who can see each task.
+    """
+    await realtime_broker.publish_all([
+        (event_type, task_audience(task.owner_id, task.group_id), {"task_id": task.id})
+        for task in tasks
+    ])
+
+def check_bulk_size(count: int):
+    if count > TASK_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A bulk request may contain at most {TASK_BULK_MAX_ITEMS} items."
+        )
+
+async def existing_ids(db: AsyncSession, column, ids) -> set[int]:
+    """
+    Returns which of the given ids exist, with one query for all of them.
+    """
+    ids = {value for value in ids if value is not None}
+    if not ids:
+        return set()
+    return set((await db.scalars(select(column).where(column.in_(ids)))).all())
+
 @router.post("/", response_model=TaskResponse)
-def create_task(task: TaskCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_task(task: TaskCreate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     # This endpoint remains the same
     check_roles(current_user, ["admin"])
     new_task = Task(**task.dict(), owner_id=current_user.id)
     db.add(new_task)
-    db.commit()
-    db.refresh(new_task)
+    await update_task_stats(db, [], task_stat_keys(new_task))
+    await db.commit()
+    await db.refresh(new_task)
+    if new_task.deadline:
+        await invalidate_task_viewers(db, new_task.owner_id, new_task.group_id)
+    await publish_task_changes("task.created", [new_task])
     return new_task
 
 @router.get("/", response_model=list[TaskResponse])
-def list_my_tasks(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # This endpoint remains the same
-    if current_user.role == "admin":
-        return db.query(Task).all()
-    else:
+@max_queries(3)
+async def list_my_tasks(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Lists the tasks visible to the current user, one page at a time in id order.
+    """
+    query = select(*TASK_COLUMNS)
+    visibility = visible_to(current_user, Task.owner_id, Task.group_id)
+    if visibility is not None:
         # A more efficient query to get personal tasks and tasks from all groups the user is in
-        user_group_ids = [group.id for group in current_user.groups]
-        return db.query(Task).filter(
-            (Task.owner_id == current_user.id) |
-            (Task.group_id.in_(user_group_ids))
-        ).all()
+        query = query.where(visibility)
+    return fast_json_response(await paginate_rows(db, query, [Task.id], page, response), response)
+
+@router.get("/stats", response_model=list[TaskStats])
+@max_queries(4)
+async def read_task_stats(
+    scope: Optional[str] = Query(None, pattern="^(all|user|group|company)$"),
+    scope_id: Optional[int] = Query(None, description="One user, group or company; omit for all of them"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Task counts by status and Eisenhower quadrant, plus overdue and due-this-week counts,
+    read from the task_stats summary table. Without a scope, admins get the totals of
+    all tasks and other users get their own tasks and one summary per group of theirs.
+    Non-admins may only ask for themselves and their groups.
+    """
+    is_admin = current_user.role == "admin"
+    if scope is None:
+        if is_admin:
+            requests = [("all", [0])]
+        else:
+            requests = [("user", [current_user.id]), ("group", sorted(current_user.group_ids))]
+    elif scope in ("all", "company"):
+        if not is_admin:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can see these statistics.")
+        if scope == "all":
+            requests = [("all", [0])]
+        else:
+            requests = [("company", None if scope_id is None else [scope_id])]
+    elif scope_id is not None:
+        allowed = scope_id == current_user.id if scope == "user" else is_group_member_cached(current_user, scope_id)
+        if not (is_admin or allowed):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view these statistics.")
+        requests = [(scope, [scope_id])]
+    elif is_admin:
+        requests = [(scope, None)]
+    else:
+        requests = [(scope, [current_user.id] if scope == "user" else sorted(current_user.group_ids))]
+
+    today = date.today()
+    results = []
+    for request_scope, scope_ids in requests:
+        if scope_ids == []:
+            continue
+        summaries = await summarize_task_stats(db, request_scope, scope_ids, today)
+        if scope_ids is None:
+            results.extend(summaries[key] for key in sorted(summaries))
+        else:
+            # Asked-for ids are always answered, with zeros if they have no tasks
+            results.extend(summaries.get(key) or empty_summary(request_scope, key) for key in scope_ids)
+    return results
+
+@router.get("/changes", response_model=TaskChanges)
+@max_queries(5)
+async def list_task_changes(
+    response: Response,
+    since: Optional[datetime] = Query(None, description="next_since from the previous call; omit for a full sync"),
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Returns the visible tasks created or updated after 'since' (all of them for a full
+    sync), one page at a time in id order, the ids of tasks deleted since then and the
+    high-water mark to poll with next time. Further pages are fetched with the same
+    'since' and the X-Next-Cursor header; deletions and next_since come with the first
+    page only. A 'since' older than the tombstone retention window, or from before the
+    user's visible tasks changed (group joined or left or deleted, role changed),
+    answers 410 and the client must resync.
+    """
+    now = datetime.now(timezone.utc)
+    # Taken before reading, so nothing committed while we read is skipped next time
+    next_since = None if page.cursor else now - timedelta(seconds=TASK_CHANGES_OVERLAP_SECONDS)
+
+    tasks_query = select(Task)
+    visibility = visible_to(current_user, Task.owner_id, Task.group_id)
+    if visibility is not None:
+        tasks_query = tasks_query.where(visibility)
+    if since is None:
+        tasks = await paginate(db, tasks_query, [Task.id], page, response)
+        return TaskChanges(tasks=tasks, deleted=[], next_since=next_since)
+
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    since = since.astimezone(timezone.utc)
+    if since < now - timedelta(days=TASK_TOMBSTONE_RETENTION_DAYS):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="'since' is too old, fetch the full task list again.")
+    visibility_changed_at = await db.scalar(select(User.visibility_changed_at).where(User.id == current_user.id))
+    if visibility_changed_at is not None:
+        if visibility_changed_at.tzinfo is None:
+            visibility_changed_at = visibility_changed_at.replace(tzinfo=timezone.utc)
+        # 'since' lies TASK_CHANGES_OVERLAP_SECONDS before the previous read, which already
+        # reflected any change made before it
+        if visibility_changed_at > since + timedelta(seconds=TASK_CHANGES_OVERLAP_SECONDS):
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="The tasks you can see have changed, fetch the full task list again."
+            )
+
+    deleted = []
+    if not page.cursor:
+        tombstones_query = select(TaskTombstone.task_id).where(TaskTombstone.deleted_at > since)
+        visibility = visible_to(current_user, TaskTombstone.owner_id, TaskTombstone.group_id)
+        if visibility is not None:
+            tombstones_query = tombstones_query.where(visibility)
+        deleted = sorted(set((await db.scalars(tombstones_query)).all()))
+
+    tasks = await paginate(db, tasks_query.where(Task.updated_at > since), [Task.id], page, response)
+    return TaskChanges(tasks=tasks, deleted=deleted, next_since=next_since)
+
+@router.post("/bulk", response_model=TaskBulkResponse)
+async def create_tasks_bulk(payload: TaskBulkCreate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    """
+    Creates many tasks with one multi-row INSERT ... RETURNING in a single transaction.
+    Items pointing at a missing group or company are reported and skipped.
+    """
+    check_roles(current_user, ["admin"])
+    check_bulk_size(len(payload.items))
+
+    groups = await existing_ids(db, Group.id, (item.group_id for item in payload.items))
+    companies = await existing_ids(db, Company.id, (item.company_id for item in payload.items))
+
+    results, rows, row_indexes = [], [], []
+    for index, item in enumerate(payload.items):
+        if item.group_id is not None and item.group_id not in groups:
+            results.append(TaskBulkResult(index=index, status_code=status.HTTP_404_NOT_FOUND, detail="Group not found"))
+        elif item.company_id is not None and item.company_id not in companies:
+            results.append(TaskBulkResult(index=index, status_code=status.HTTP_404_NOT_FOUND, detail="Company not found"))
+        else:
+            rows.append({**item.dict(), "owner_id": current_user.id})
+            row_indexes.append(index)
+
+    if rows:
+        created = (await db.scalars(insert(Task).returning(Task, sort_by_parameter_order=True), rows)).all()
+        await update_task_stats(db, [], [key for task in created for key in task_stat_keys(task)])
+        await db.commit()
+        await invalidate_tasks_viewers(db, [(task.owner_id, task.group_id) for task in created if task.deadline])
+        await publish_task_changes("task.created", created)
+        results.extend(
+            TaskBulkResult(index=index, id=task.id, status_code=status.HTTP_201_CREATED, task=TaskResponse.model_validate(task))
+            for index, task in zip(row_indexes, created)
+        )
+
+    results.sort(key=lambda result: result.index)
+    return TaskBulkResponse(results=results)
+
+@router.put("/bulk", response_model=TaskBulkResponse)
+async def update_tasks_bulk(payload: TaskBulkUpdate, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    """
+    Applies many task updates in a single transaction, with the same permission rules
+    as PUT /tasks/{task_id}. Items that fail are reported and the rest are saved.
+    """
+    check_bulk_size(len(payload.items))
+
+    tasks = {
+        task.id: task
+        for task in (await db.scalars(select(Task).where(Task.id.in_({item.id for item in payload.items})))).all()
+    }
+    companies = await existing_ids(db, Company.id, (item.company_id for item in payload.items))
+
+    results, updated, calendar_changes = [], [], []
+    stats_before, stats_after = [], []
+    for index, item in enumerate(payload.items):
+        task = tasks.get(item.id)
+        update_data = item.dict(exclude_unset=True, exclude={"id"})
+        if task is None:
+            results.append(TaskBulkResult(index=index, id=item.id, status_code=status.HTTP_404_NOT_FOUND, detail="Task not found"))
+            continue
+
+        if current_user.role != "admin" and task.owner_id != current_user.id:
+            if not (task.group_id and is_group_member_cached(current_user, task.group_id)):
+                results.append(TaskBulkResult(index=index, id=item.id, status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to update this task."))
+                continue
+            if not set(update_data.keys()).issubset(MEMBER_UPDATABLE_FIELDS):
+                results.append(TaskBulkResult(
+                    index=index, id=item.id, status_code=status.HTTP_403_FORBIDDEN,
+                    detail="As a group member, you can only update the task's status or completion."
+                ))
+                continue
+        if update_data.get("company_id") is not None and update_data["company_id"] not in companies:
+            results.append(TaskBulkResult(index=index, id=item.id, status_code=status.HTTP_404_NOT_FOUND, detail="Company not found"))
+            continue
+
+        had_deadline = task.deadline is not None
+        stats_before.extend(task_stat_keys(task))
+        apply_task_update(task, update_data)
+        stats_after.extend(task_stat_keys(task))
+        if (had_deadline or task.deadline) and update_data.keys() & {"title", "deadline", "deadline_all_day"}:
+            calendar_changes.append((task.owner_id, task.group_id))
+        updated.append((index, task))
+
+    if updated:
+        await update_task_stats(db, stats_before, stats_after)
+        await db.commit()
+        await invalidate_tasks_viewers(db, calendar_changes)
+        await publish_task_changes("task.updated", list({task.id: task for _, task in updated}.values()))
+        results.extend(
+            TaskBulkResult(index=index, id=task.id, status_code=status.HTTP_200_OK, task=TaskResponse.model_validate(task))
+            for index, task in updated
+        )
+
+    results.sort(key=lambda result: result.index)
+    return TaskBulkResponse(results=results)
+
+@router.post("/bulk-delete", response_model=TaskBulkResponse)
+async def delete_tasks_bulk(payload: TaskBulkDelete, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    """
+    Deletes many tasks with a single DELETE statement. Only admins and task owners may
+    delete; other ids are reported as 403 or 404.
+    """
+    check_bulk_size(len(payload.ids))
+
+    tasks = {
+        task.id: task
+        for task in (await db.scalars(select(Task).where(Task.id.in_(set(payload.ids))))).all()
+    }
+
+    results, deleted = [], {}
+    for index, task_id in enumerate(payload.ids):
+        task = tasks.get(task_id)
+        if task is None or task_id in deleted:
+            results.append(TaskBulkResult(index=index, id=task_id, status_code=status.HTTP_404_NOT_FOUND, detail="Task not found"))
+        elif not (current_user.role == "admin" or task.owner_id == current_user.id):
+            results.append(TaskBulkResult(index=index, id=task_id, status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this task."))
+        else:
+            deleted[task_id] = task
+            results.append(TaskBulkResult(index=index, id=task_id, status_code=status.HTTP_204_NO_CONTENT))
+
+    if deleted:
+        calendar_changes = [(task.owner_id, task.group_id) for task in deleted.values() if task.deadline]
+        await record_deletions(db, list(deleted.values()))
+        await update_task_stats(db, [key for task in deleted.values() for key in task_stat_keys(task)], [])
+        await db.execute(delete(Task).where(Task.id.in_(deleted.keys())))
+        await db.commit()
+        await invalidate_tasks_viewers(db, calendar_changes)
+        await publish_task_changes("task.deleted", list(deleted.values()))
+
+    return TaskBulkResponse(results=results)
 
 @router.get("/{task_id}", response_model=TaskResponse)
-def read_task(task_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+@max_queries(3)
+async def read_task(task_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     # This endpoint remains the same
-    task = db.query(Task).filter(Task.id == task_id).first()
+    task = await db.scalar(select(Task).where(Task.id == task_id))
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
     is_owner = task.owner_id == current_user.id
     is_admin = current_user.role == "admin"
-    is_member = False
-    if task.group_id:
-        group = db.query(Group).filter(Group.id == task.group_id).first()
-        if group and current_user in group.members:
-            is_member = True
+    is_member = task.group_id is not None and is_group_member_cached(current_user, task.group_id)
 
     if not (is_admin or is_owner or is_member):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view this task.")
@@ -53,51 +385,57 @@ def read_task(task_id: int, db: Session = Depends(get_db), current_user: User =
     return task
 
 @router.put("/{task_id}", response_model=TaskResponse)
-def update_task(
+async def update_task(
     task_update: TaskUpdate,
     task: Task = Depends(get_task_for_update), # <-- Use the new dependency
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user) # <-- Still need this for the final check
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user) # <-- Still need this for the final check
 ):
     """
     Updates a task after verifying permissions with the get_task_for_update dependency.
     """
     update_data = task_update.dict(exclude_unset=True)
+    had_deadline = task.deadline is not None
 
     # If the user is neither admin nor owner, they must be a group member.
     # The dependency already confirmed this. Now, check which fields they are trying to update.
     if current_user.role != "admin" and task.owner_id != current_user.id:
-        allowed_fields_for_member = {"status", "completed"}
-        if not set(update_data.keys()).issubset(allowed_fields_for_member):
+        if not set(update_data.keys()).issubset(MEMBER_UPDATABLE_FIELDS):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="As a group member, you can only update the task's status or completion."
             )
 
     # Apply the updates
-    for field, value in update_data.items():
-        setattr(task, field, value)
+    stats_before = task_stat_keys(task)
+    apply_task_update(task, update_data)
+    await update_task_stats(db, stats_before, task_stat_keys(task))
 
-    # Handle the logic where status and completed are linked
-    if "completed" in update_data:
-        task.status = "completed" if task.completed else "new"
-    elif "status" in update_data:
-        task.completed = task.status == "completed"
+    await db.commit()
+    await db.refresh(task)
 
-    db.commit()
-    db.refresh(task)
+    # Only the title and deadline fields show up on the calendar
+    if (had_deadline or task.deadline) and update_data.keys() & {"title", "deadline", "deadline_all_day"}:
+        await invalidate_task_viewers(db, task.owner_id, task.group_id)
+    await publish_task_changes("task.updated", [task])
     return task
 
 @router.delete("/{task_id}", status_code=204)
-def delete_task(task_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def delete_task(task_id: int, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
     # This endpoint remains the same
-    task = db.query(Task).filter(Task.id == task_id).first()
+    task = await db.scalar(select(Task).where(Task.id == task_id))
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     if not (current_user.role == "admin" or task.owner_id == current_user.id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this task.")
 
-    db.delete(task)
-    db.commit()
+    await record_deletions(db, [task])
+    await update_task_stats(db, task_stat_keys(task), [])
+    await db.delete(task)
+    await db.commit()
+    # Invalidated after the commit, so no calendar request can cache the task again in between
+    if task.deadline:
+        await invalidate_task_viewers(db, task.owner_id, task.group_id)
+    await publish_task_changes("task.deleted", [task])
     return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,29 +1,64 @@
 # routers/utils.py
+import logging
+from datetime import datetime, timezone
+from typing import Iterable
 from fastapi import HTTPException, status
-from models import User  # Import User model
+from sqlalchemy import exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import User, group_members  # Import User model
+from utils.principal_cache import Principal
 
-def check_roles(current_user: User, allowed_roles: list[str]):
+logger = logging.getLogger(__name__)
+
+async def mark_visibility_changed(db: AsyncSession, user_ids: Iterable[int]):
+    """
+    Records, in the caller's transaction, that these users may now see a different set
+    of tasks, so their next GET /tasks/changes poll asks for a full resync.
+    """
+    user_ids = list(user_ids)
+    if user_ids:
+        await db.execute(
+            update(User).where(User.id.in_(user_ids)).values(visibility_changed_at=datetime.now(timezone.utc))
+        )
+
+def check_roles(current_user: Principal, allowed_roles: list[str]):
     """
     Checks if the current_user has at least one of the allowed roles.
     Raises HTTPException if not authorized.
     """
-    # --- NEW: Debug print for role check ---
-    print(f"DEBUG_ROLE: Checking user ID {current_user.id} ({current_user.email}) with role '{current_user.role}' against allowed roles: {allowed_roles}")
-    # --- END NEW ---
+    logger.debug("Checking user ID %s (%s) with role '%s' against allowed roles: %s",
+                 current_user.id, current_user.email, current_user.role, allowed_roles)
     if current_user.role not in allowed_roles:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to perform this action. Insufficient role."
         )
 
-def is_admin_or_owner(current_user: User, owner_id: int):
+def is_admin_or_owner(current_user: Principal, owner_id: int):
     """
     Checks if the current_user is an 'admin' or the owner of a resource.
     """
     return current_user.role == "admin" or current_user.id == owner_id
 
-def is_admin_or_group_member(current_user: User, group_members: list[User]):
+def is_group_member_cached(current_user: Principal, group_id: int) -> bool:
+    """
+    Checks the current_user's membership against the group ids cached on the Principal,
+    without a query. Membership changes made through the API invalidate that cache.
+    """
+    return group_id in current_user.group_ids
+
+async def is_group_member(db: AsyncSession, group_id: int, user_id: int) -> bool:
+    """
+    Checks whether any user is a member of a group with a single indexed EXISTS query,
+    instead of loading the group's member list.
+    """
+    return bool(await db.scalar(select(exists().where(
+        group_members.c.group_id == group_id,
+        group_members.c.user_id == user_id
+    ))))
+
+def is_admin_or_group_member(current_user: Principal, group_id: int):
     """
     Checks if the current_user is an 'admin' or a member of the given group.
     """
-    return current_user.role == "admin" or current_user in group_members
\ No newline at end of file
+    return current_user.role == "admin" or is_group_member_cached(current_user, group_id)
\ No newline at end of file
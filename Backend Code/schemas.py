@@ -1,6 +1,11 @@
 from datetime import datetime, date
 from pydantic import BaseModel, EmailStr, ConfigDict, computed_field
-from typing import Optional, List
+from typing import Dict, Optional, List
+
+def full_name(first_name: Optional[str], surname: Optional[str]) -> str:
+    if first_name and surname:
+        return f"{first_name} {surname}"
+    return first_name or surname or "No name set"
 
 # --- User Schemas (No changes here) ---
 class UserCreate(BaseModel):
@@ -22,9 +27,7 @@ class UserResponse(BaseModel):
     @computed_field
     @property
     def full_name(self) -> str:
-        if self.first_name and self.surname:
-            return f"{self.first_name} {self.surname}"
-        return self.first_name or self.surname or "No name set"
+        return full_name(self.first_name, self.surname)
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -74,8 +77,51 @@ class TaskResponse(BaseModel):
     owner_id: int
     group_id: Optional[int] = None
     company_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
     model_config = ConfigDict(from_attributes=True)
 
+# --- Bulk task schemas ---
+class TaskBulkCreateItem(TaskCreate):
+    group_id: Optional[int] = None
+
+class TaskBulkUpdateItem(TaskUpdate):
+    id: int
+
+class TaskBulkCreate(BaseModel):
+    items: List[TaskBulkCreateItem]
+
+class TaskBulkUpdate(BaseModel):
+    items: List[TaskBulkUpdateItem]
+
+class TaskBulkDelete(BaseModel):
+    ids: List[int]
+
+class TaskBulkResult(BaseModel):
+    index: int  # Position of the item in the request
+    id: Optional[int] = None
+    status_code: int  # What the single-task endpoint would have answered (201, 200, 204, 403, 404, ...)
+    detail: Optional[str] = None
+    task: Optional[TaskResponse] = None
+
+class TaskBulkResponse(BaseModel):
+    results: List[TaskBulkResult]
+
+class TaskChanges(BaseModel):
+    tasks: List[TaskResponse]  # Created or updated since the requested point
+    deleted: List[int]  # Ids of tasks deleted since the requested point
+    next_since: Optional[datetime] = None  # Pass back as 'since' on the next poll (first page only)
+
+class TaskStats(BaseModel):
+    scope: str  # "all", "user", "group" or "company"
+    scope_id: Optional[int] = None  # None for "all"
+    total: int
+    by_status: Dict[str, int]
+    # urgent_important, not_urgent_important, urgent_not_important, not_urgent_not_important
+    by_quadrant: Dict[str, int]
+    overdue: int  # Open tasks whose deadline day has passed
+    due_this_week: int  # Open tasks due today or in the next six days
+
 # --- Group Schemas (No changes here) ---
 class GroupCreate(BaseModel):
     name: str
@@ -148,6 +194,18 @@ class CompanyOut(CompanyBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
 
+class CompanyBulkResult(BaseModel):
+    index: int  # Position of the item, or of the data row in a CSV, counting from 0
+    id: Optional[int] = None
+    status_code: int  # What POST /companies/ would have answered (201, 400, 422)
+    detail: Optional[str] = None
+
+class CompanyBulkResponse(BaseModel):
+    created: int
+    failed: int
+    dry_run: bool = False  # Nothing was written, ids are missing
+    results: List[CompanyBulkResult]
+
 # --- Event Schemas ---
 class EventBase(BaseModel):
     title: str
@@ -1,10 +1,19 @@
 # seed.py
+import argparse
+import csv
+import io
+import itertools
+import random
 import sys
 import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import exists, func, insert, select
 from sqlalchemy.orm import Session
-from database import SessionLocal
-from models import User, Company
+from database import SessionLocal, engine
+from models import User, Company, Event, Group, Task, group_members
 from routers.auth import get_password_hash # Import the hashing function
+from utils.task_stats import rebuild_task_stats
 
 # This ensures the script can find your other project files
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
@@ -24,6 +33,24 @@ INITIAL_COMPANIES = [
     {"name": "Best Solution Cars"},
 ]
 
+# 3. Synthetic data for staging and benchmark environments (python seed.py --bulk)
+SYNTHETIC_ADMIN_EMAIL = "synthetic-admin@example.com"
+SYNTHETIC_USER_EMAIL = "synthetic-user-{n}@example.com"
+SYNTHETIC_PASSWORD = "synthetic"
+# Stored in the description of generated tasks and events so reruns can count them
+SYNTHETIC_MARKER = "Generated by seed.py --bulk"
+
+FIRST_NAMES = [
+    "Maria", "Eleni", "Katerina", "Sofia", "Anna", "Georgia", "Ioanna", "Dimitra", "Vasiliki", "Christina",
+    "Giorgos", "Kostas", "Nikos", "Dimitris", "Giannis", "Panagiotis", "Vasilis", "Christos", "Andreas", "Michalis",
+]
+SURNAMES = [
+    "Papadopoulos", "Nikolaidis", "Georgiou", "Konstantinou", "Ioannou", "Vasileiou", "Dimitriou", "Pappas",
+    "Karagiannis", "Oikonomou", "Makris", "Athanasiou", "Antoniou", "Alexiou", "Christodoulou", "Kabanis",
+]
+TASK_WORDS = ["Review", "Prepare", "Send", "Audit", "Update", "Call", "Invoice", "Plan", "Check", "Renew"]
+TASK_OBJECTS = ["contract", "VAT return", "payroll", "offer", "report", "insurance", "lease", "budget", "supplier list"]
+
 # ---------------------------------------------
 
 def seed_database():
@@ -53,15 +80,16 @@ def seed_database():
             print(f"Admin user '{ADMIN_EMAIL}' already exists. Skipping.")
 
         # --- Create Initial Companies ---
+        # One query for the names that already exist and one commit for the rest
+        names = [company_data["name"] for company_data in INITIAL_COMPANIES]
+        existing = set(db.scalars(select(Company.name).where(Company.name.in_(names))))
         for company_data in INITIAL_COMPANIES:
-            company = db.query(Company).filter(Company.name == company_data["name"]).first()
-            if not company:
-                new_company = Company(**company_data)
-                db.add(new_company)
-                db.commit()
-                print(f"Company '{company_data['name']}' created successfully.")
-            else:
+            if company_data["name"] in existing:
                 print(f"Company '{company_data['name']}' already exists. Skipping.")
+            else:
+                db.add(Company(**company_data))
+                print(f"Company '{company_data['name']}' created successfully.")
+        db.commit()
         
         print("\nDatabase seeding complete!")
         print(f"You can log in with: {ADMIN_EMAIL} / {ADMIN_PASSWORD}")
@@ -72,6 +100,233 @@ def seed_database():
     finally:
         db.close()
 
+
+def _batched(rows, batch_size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_batch(connection, table, batch: list[dict]):
+    # PostgreSQL COPY in CSV format; unquoted empty fields are read as NULL
+    columns = list(batch[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(["" if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    with connection.connection.driver_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _use_copy() -> bool:
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.connect() as connection:
+        with connection.connection.driver_connection.cursor() as cursor:
+            return hasattr(cursor, "copy_expert")
+
+
+def bulk_load(table, rows, batch_size: int, use_copy: bool) -> int:
+    """
+    Writes the rows in batches with COPY (PostgreSQL) or executemany, committing each
+    batch, and prints the running rate. Returns the number of rows written.
+    """
+    started, written = time.perf_counter(), 0
+    for batch in _batched(rows, batch_size):
+        with engine.begin() as connection:
+            if use_copy:
+                _copy_batch(connection, table, batch)
+            else:
+                connection.execute(insert(table), batch)
+        written += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"\r  {table.name}: {written:,} rows ({written / elapsed:,.0f} rows/s)", end="", flush=True)
+    if written:
+        print()
+    else:
+        print(f"  {table.name}: already complete")
+    return written
+
+
+def _count(statement) -> int:
+    with engine.connect() as connection:
+        return connection.scalar(statement)
+
+
+def _ids(statement) -> list[int]:
+    with engine.connect() as connection:
+        return list(connection.scalars(statement))
+
+
+def _synthetic_users(start: int, stop: int, rng: random.Random, hashed_password: str):
+    for n in range(start, stop):
+        birthday = date(1950, 1, 1) + timedelta(days=rng.randrange(365 * 55))
+        yield {
+            "email": SYNTHETIC_USER_EMAIL.format(n=n),
+            "hashed_password": hashed_password,
+            "role": "user",
+            "first_name": rng.choice(FIRST_NAMES),
+            "surname": rng.choice(SURNAMES),
+            "birthday": birthday,
+            # Core inserts bypass the model's @validates hook, so fill it in here
+            "birthday_month_day": birthday.month * 100 + birthday.day,
+            "is_active": True,
+        }
+
+
+def _synthetic_tasks(start: int, stop: int, rng: random.Random, user_ids: list[int], group_ids: list[int],
+                     company_ids: list[int]):
+    now = datetime.now(timezone.utc)
+    for n in range(start, stop):
+        deadline = now + timedelta(minutes=rng.randrange(-365 * 24 * 60, 365 * 24 * 60))
+        task_status = rng.choice(("new", "new", "in_progress", "completed"))
+        # Never in the future, or every GET /tasks/changes?since=... would return the task again
+        created_at = min(now, deadline - timedelta(days=rng.randrange(1, 60)))
+        yield {
+            "title": f"{rng.choice(TASK_WORDS)} {rng.choice(TASK_OBJECTS)} #{n}",
+            "description": SYNTHETIC_MARKER,
+            "deadline_all_day": rng.random() < 0.3,
+            "deadline": deadline.replace(tzinfo=None),
+            "urgency": rng.random() < 0.2,
+            "important": rng.random() < 0.3,
+            "status": task_status,
+            "completed": task_status == "completed",
+            "owner_id": rng.choice(user_ids),
+            # About half of the tasks belong to a group
+            "group_id": rng.choice(group_ids) if group_ids and rng.random() < 0.5 else None,
+            "company_id": rng.choice(company_ids) if company_ids and rng.random() < 0.6 else None,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+
+
+def seed_bulk(users: int, groups: int, memberships_per_user: int, companies: int, tasks: int, events: int,
+              batch_size: int = 10_000, seed: int = 42) -> dict:
+    """
+    Tops the database up to the given numbers of synthetic users, groups, companies,
+    tasks and events. Rows that already exist from an earlier (or interrupted) run
+    are counted, not recreated, so this is safe to run repeatedly.
+    """
+    use_copy = _use_copy()
+    print(f"Bulk seeding with {'COPY' if use_copy else 'executemany'} in batches of {batch_size:,}...")
+    started = time.perf_counter()
+    # bcrypt is deliberately slow, so every synthetic user shares one precomputed hash
+    hashed_password = get_password_hash(SYNTHETIC_PASSWORD)
+    users_table, groups_table, companies_table = User.__table__, Group.__table__, Company.__table__
+    tasks_table, events_table = Task.__table__, Event.__table__
+    written = {}
+
+    admin_rows = []
+    if not _count(select(func.count()).select_from(users_table).where(users_table.c.email == SYNTHETIC_ADMIN_EMAIL)):
+        admin_rows.append({
+            "email": SYNTHETIC_ADMIN_EMAIL, "hashed_password": hashed_password, "role": "admin",
+            "first_name": "Synthetic", "surname": "Admin", "is_active": True,
+        })
+    # Generated names are numbered, so the existing count is where the next batch starts
+    user_email = SYNTHETIC_USER_EMAIL.format(n="%")
+    have = _count(select(func.count()).select_from(users_table).where(users_table.c.email.like(user_email)))
+    written["users"] = bulk_load(
+        users_table,
+        itertools.chain(
+            admin_rows, _synthetic_users(have + 1, users + 1, random.Random(f"{seed}-users-{have}"), hashed_password)
+        ),
+        batch_size, use_copy,
+    )
+
+    have = _count(select(func.count()).select_from(groups_table).where(groups_table.c.name.like("Synthetic team %")))
+    written["groups"] = bulk_load(
+        groups_table, ({"name": f"Synthetic team {n}"} for n in range(have + 1, groups + 1)), batch_size, use_copy
+    )
+
+    have = _count(select(func.count()).select_from(companies_table).where(companies_table.c.name.like("Synthetic company %")))
+    written["companies"] = bulk_load(
+        companies_table,
+        ({"name": f"Synthetic company {n}", "vat_number": f"SYN{n:09d}"} for n in range(have + 1, companies + 1)),
+        batch_size, use_copy,
+    )
+
+    user_ids = _ids(select(users_table.c.id).where(users_table.c.email.like(user_email)).order_by(users_table.c.id))
+    group_ids = _ids(select(groups_table.c.id).where(groups_table.c.name.like("Synthetic team %")))
+    company_ids = _ids(select(companies_table.c.id).where(companies_table.c.name.like("Synthetic company %")))
+
+    # Memberships only for synthetic users that have none yet
+    unassigned = _ids(
+        select(users_table.c.id)
+        .where(users_table.c.email.like(user_email), ~exists().where(group_members.c.user_id == users_table.c.id))
+        .order_by(users_table.c.id)
+    )
+    rng = random.Random(f"{seed}-memberships-{len(unassigned)}")
+    written["group_members"] = bulk_load(
+        group_members,
+        (
+            {"group_id": group_id, "user_id": user_id}
+            for user_id in (unassigned if group_ids else [])
+            for group_id in rng.sample(group_ids, min(memberships_per_user, len(group_ids)))
+        ),
+        batch_size, use_copy,
+    )
+
+    have = _count(select(func.count()).select_from(tasks_table).where(tasks_table.c.description == SYNTHETIC_MARKER))
+    written["tasks"] = bulk_load(
+        tasks_table,
+        _synthetic_tasks(have + 1, tasks + 1, random.Random(f"{seed}-tasks-{have}"), user_ids, group_ids, company_ids)
+        if user_ids else [],
+        batch_size, use_copy,
+    )
+    if written["tasks"]:
+        # The rows were copied in without going through the API, so recount them
+        with engine.begin() as connection:
+            print(f"  task_stats: rebuilt, {rebuild_task_stats(connection):,} rows")
+
+    admin_id = _ids(select(users_table.c.id).where(users_table.c.email == SYNTHETIC_ADMIN_EMAIL))[0]
+    have = _count(select(func.count()).select_from(events_table).where(events_table.c.description == SYNTHETIC_MARKER))
+    rng = random.Random(f"{seed}-events-{have}")
+    now = datetime.now(timezone.utc)
+    written["events"] = bulk_load(
+        events_table,
+        (
+            {
+                "title": f"Seminar {n}",
+                "description": SYNTHETIC_MARKER,
+                "location": rng.choice(("Athens", "Thessaloniki", "Patras", "Online")),
+                "event_date": now + timedelta(hours=rng.randrange(-365 * 24, 365 * 24)),
+                "created_by_id": admin_id,
+            }
+            for n in range(have + 1, events + 1)
+        ),
+        batch_size, use_copy,
+    )
+
+    elapsed = time.perf_counter() - started
+    total = sum(written.values())
+    print(f"\nWrote {total:,} rows in {elapsed:,.1f}s ({total / elapsed:,.0f} rows/s).")
+    print(f"Log in as {SYNTHETIC_ADMIN_EMAIL} or {SYNTHETIC_USER_EMAIL.format(n='<n>')} / {SYNTHETIC_PASSWORD}")
+    return written
+
+
+def add_bulk_arguments(parser: argparse.ArgumentParser, defaults: dict):
+    for name, default in defaults.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42, help="Random seed, for reproducible datasets")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the database.")
+    parser.add_argument("--bulk", action="store_true", help="Also generate synthetic data at the sizes below")
+    add_bulk_arguments(parser, dict(users=1_000, groups=50, memberships_per_user=2, companies=200, tasks=100_000, events=500))
+    args = parser.parse_args()
+
     seed_database()
+    if args.bulk:
+        seed_bulk(
+            args.users, args.groups, args.memberships_per_user, args.companies, args.tasks, args.events,
+            args.batch_size, args.seed,
+        )
 
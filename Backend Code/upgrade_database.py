@@ -0,0 +1,201 @@
+# upgrade_database.py
+"""
+Brings an existing database up to date with the models, one numbered step at a time,
+without touching its data.
+
+    python upgrade_database.py           # apply the pending steps
+    python upgrade_database.py --status  # show the applied and pending steps
+
+Applied steps are recorded in the schema_version table. A database without any of the
+app's tables is created from the models and marked as up to date. Every step checks
+what already exists first, so databases created with create_all at any earlier commit
+upgrade cleanly. Index builds lock writes to their table while they run, so upgrade
+large PostgreSQL databases outside busy hours.
+"""
+import argparse
+import sys
+import os
+from datetime import datetime, timezone
+
+# Add the project root to the sys.path to allow imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+from database import Base, engine
+from models import EmailOutbox, Event, Task, TaskStat, TaskTombstone, User, group_members
+from utils.task_stats import rebuild_task_stats
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def _has_column(connection, table: str, column: str) -> bool:
+    return any(existing["name"] == column for existing in inspect(connection).get_columns(table))
+
+
+def _add_column(connection, table, column_name: str):
+    column = table.c[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_name} {column_type}"))
+
+
+def _create_indexes(connection, table, names: list[str]):
+    existing = {index["name"] for index in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name in names and index.name not in existing:
+            print(f"  creating index {index.name}")
+            index.create(connection)
+
+
+def step_1_user_search_and_birthdays(connection):
+    users = User.__table__
+    if not _has_column(connection, "users", "birthday_month_day"):
+        _add_column(connection, users, "birthday_month_day")
+    if connection.dialect.name == "postgresql":
+        month_day = "EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday)"
+    else:
+        month_day = "CAST(strftime('%m', birthday) AS INTEGER) * 100 + CAST(strftime('%d', birthday) AS INTEGER)"
+    connection.execute(text(
+        f"UPDATE users SET birthday_month_day = {month_day} WHERE birthday IS NOT NULL AND birthday_month_day IS NULL"
+    ))
+    _create_indexes(connection, users, ["ix_users_birthday_month_day"])
+    # Trigram indexes for the admin user search only exist on PostgreSQL
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        _create_indexes(connection, users, ["ix_users_email_trgm", "ix_users_first_name_trgm", "ix_users_surname_trgm"])
+
+
+def step_2_task_change_tracking(connection):
+    tasks = Task.__table__
+    for column_name in ("created_at", "updated_at"):
+        if not _has_column(connection, "tasks", column_name):
+            _add_column(connection, tasks, column_name)
+            connection.execute(text(f"UPDATE tasks SET {column_name} = CURRENT_TIMESTAMP WHERE {column_name} IS NULL"))
+            # SQLite cannot add NOT NULL to an existing column; the model fills it in anyway
+            if connection.dialect.name == "postgresql":
+                connection.execute(text(f"ALTER TABLE tasks ALTER COLUMN {column_name} SET NOT NULL"))
+    _create_indexes(connection, tasks, ["ix_tasks_updated_at"])
+    TaskTombstone.__table__.create(connection, checkfirst=True)
+
+
+def step_3_email_outbox(connection):
+    EmailOutbox.__table__.create(connection, checkfirst=True)
+
+
+def step_4_task_and_membership_indexes(connection):
+    _create_indexes(connection, Task.__table__, [
+        "ix_tasks_owner_id_deadline", "ix_tasks_group_id_id", "ix_tasks_deadline", "ix_tasks_company_id",
+    ])
+    _create_indexes(connection, Event.__table__, ["ix_events_event_date"])
+
+    if inspect(connection).get_pk_constraint("group_members")["constrained_columns"]:
+        return
+    print("  adding the group_members primary key (duplicate memberships are removed)")
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("DELETE FROM group_members WHERE group_id IS NULL OR user_id IS NULL"))
+        connection.execute(text(
+            "DELETE FROM group_members a USING group_members b "
+            "WHERE a.ctid < b.ctid AND a.group_id = b.group_id AND a.user_id = b.user_id"
+        ))
+        connection.execute(text(
+            "ALTER TABLE group_members ALTER COLUMN group_id SET NOT NULL, ALTER COLUMN user_id SET NOT NULL"
+        ))
+        connection.execute(text("ALTER TABLE group_members ADD PRIMARY KEY (group_id, user_id)"))
+        _create_indexes(connection, group_members, ["ix_group_members_user_id"])
+    else:
+        # SQLite cannot add a primary key to an existing table, so rebuild it
+        connection.execute(text("ALTER TABLE group_members RENAME TO group_members_old"))
+        for index in inspect(connection).get_indexes("group_members_old"):
+            connection.execute(text(f"DROP INDEX {index['name']}"))
+        group_members.create(connection)
+        connection.execute(text(
+            "INSERT INTO group_members (group_id, user_id) SELECT DISTINCT group_id, user_id FROM group_members_old "
+            "WHERE group_id IS NOT NULL AND user_id IS NOT NULL"
+        ))
+        connection.execute(text("DROP TABLE group_members_old"))
+
+
+def step_5_task_stats(connection):
+    TaskStat.__table__.create(connection, checkfirst=True)
+    print(f"  counted existing tasks into {rebuild_task_stats(connection):,} task_stats rows")
+
+
+def step_6_calendar_feed_tokens(connection):
+    if not _has_column(connection, "users", "calendar_token"):
+        _add_column(connection, User.__table__, "calendar_token")
+    _create_indexes(connection, User.__table__, ["ix_users_calendar_token"])
+
+
+def step_7_task_visibility_changes(connection):
+    if not _has_column(connection, "users", "visibility_changed_at"):
+        _add_column(connection, User.__table__, "visibility_changed_at")
+
+
+STEPS = [
+    (1, "Birthday month/day lookup column and trigram user search indexes", step_1_user_search_and_birthdays),
+    (2, "Task created_at/updated_at columns and task tombstones", step_2_task_change_tracking),
+    (3, "Email outbox table", step_3_email_outbox),
+    (4, "Task, event and group membership indexes; group_members primary key", step_4_task_and_membership_indexes),
+    (5, "Task statistics summary table", step_5_task_stats),
+    (6, "Calendar feed tokens", step_6_calendar_feed_tokens),
+    (7, "When each user's task visibility last changed", step_7_task_visibility_changes),
+]
+
+
+def applied_versions(connection) -> set[int]:
+    schema_version.create(connection, checkfirst=True)
+    return set(connection.scalars(select(schema_version.c.version)))
+
+
+def record(connection, version: int, description: str):
+    connection.execute(schema_version.insert().values(
+        version=version, description=description, applied_at=datetime.now(timezone.utc)
+    ))
+
+
+def upgrade():
+    with engine.begin() as connection:
+        existing_tables = set(inspect(connection).get_table_names())
+        done = applied_versions(connection)
+        if not existing_tables & set(Base.metadata.tables):
+            print("Empty database: creating all tables from the models.")
+            Base.metadata.create_all(bind=connection)
+            for version, description, _ in STEPS:
+                record(connection, version, description)
+            print(f"Database created at version {STEPS[-1][0]}.")
+            return
+
+    pending = [step for step in STEPS if step[0] not in done]
+    if not pending:
+        print(f"Database is up to date (version {max(done)}).")
+        return
+    for version, description, apply in pending:
+        print(f"Applying {version}: {description}...")
+        # Each step and its version row commit together
+        with engine.begin() as connection:
+            apply(connection)
+            record(connection, version, description)
+    print(f"Database upgraded to version {pending[-1][0]}.")
+
+
+def status():
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+    for version, description, _ in STEPS:
+        print(f"{version:>3} {'applied' if version in done else 'pending':<8} {description}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade the database schema.")
+    parser.add_argument("--status", action="store_true", help="Only show which steps are applied")
+    args = parser.parse_args()
+    if args.status:
+        status()
+    else:
+        upgrade()
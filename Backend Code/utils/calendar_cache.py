@@ -0,0 +1,194 @@
+# utils/calendar_cache.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import group_members
+from utils.realtime import realtime_broker
+
+# Number of users whose calendar responses are kept in memory (least recently used
+# users are evicted first). Set to 0 to disable the cache.
+CALENDAR_CACHE_MAX_USERS = int(os.getenv("CALENDAR_CACHE_MAX_USERS", 1024))
+# Number of distinct date windows remembered per user
+CALENDAR_CACHE_WINDOWS_PER_USER = int(os.getenv("CALENDAR_CACHE_WINDOWS_PER_USER", 8))
+# Seconds an entry is served at most. Invalidations reach other workers through the
+# realtime broker (REALTIME_BACKEND=postgres); this bounds how stale a calendar can get
+# when they cannot (memory backend with several workers, listener reconnecting). 0 = no limit.
+CALENDAR_CACHE_TTL_SECONDS = float(os.getenv("CALENDAR_CACHE_TTL_SECONDS", 300))
+# Invalidations naming more users are shared with other workers as "drop everything",
+# keeping the notification payload small
+SHARED_INVALIDATION_MAX_USERS = 500
+
+CALENDAR_INVALIDATED = "calendar_cache.invalidated"
+
+
+@dataclass(frozen=True)
+class CachedCalendar:
+    body: bytes
+    etag: str
+    # When the data behind the body was read (sent as Last-Modified)
+    last_modified: datetime
+    stored_at: float = field(default_factory=time.monotonic)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks an If-None-Match request header against an ETag, accepting lists,
+    weak validators and '*'.
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+class CalendarCache:
+    """
+    In-process cache of rendered /calendar/events responses and iCalendar feeds.
+
+    Entries are grouped per user and keyed by (role, group ids, start, end), so a role
+    or membership change never serves a response built for the old visibility.
+    Writers invalidate the users who can see the changed rows; a generation counter
+    stops a request that started before an invalidation from storing stale data.
+    Invalidations are also handed to 'publisher' so other workers apply them.
+    """
+
+    def __init__(self, max_users: int, windows_per_user: int, ttl_seconds: float = 0):
+        self.max_users = max_users
+        self.windows_per_user = windows_per_user
+        self.ttl_seconds = ttl_seconds
+        self.publisher: Optional[Callable[[dict], None]] = None
+        self._lock = threading.Lock()
+        self._users: OrderedDict[int, tuple[str, OrderedDict]] = OrderedDict()
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_users > 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, user_id: int, key: tuple) -> Optional[CachedCalendar]:
+        with self._lock:
+            bucket = self._users.get(user_id)
+            if bucket is None:
+                return None
+            entry = bucket[1].get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry.stored_at > self.ttl_seconds:
+                del bucket[1][key]
+                return None
+            if entry is not None:
+                self._users.move_to_end(user_id)
+                bucket[1].move_to_end(key)
+            return entry
+
+    def set(self, user_id: int, role: str, key: tuple, body: bytes, generation: int,
+            last_modified: Optional[datetime] = None) -> CachedCalendar:
+        entry = CachedCalendar(
+            body=body, etag=make_etag(body), last_modified=last_modified or datetime.now(timezone.utc)
+        )
+        if not self.enabled:
+            return entry
+        with self._lock:
+            # Something was invalidated while this response was being built
+            if generation != self._generation:
+                return entry
+            bucket = self._users.get(user_id)
+            if bucket is None or bucket[0] != role:
+                bucket = (role, OrderedDict())
+                self._users[user_id] = bucket
+            bucket[1][key] = entry
+            self._users.move_to_end(user_id)
+            while len(bucket[1]) > self.windows_per_user:
+                bucket[1].popitem(last=False)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return entry
+
+    def invalidate_users(self, user_ids: Iterable[int], include_admins: bool = True):
+        """
+        Drops the cached responses of the given users and, by default, of every admin
+        (admins can see all tasks), here and in the other workers.
+        """
+        user_ids = list(user_ids)
+        self._drop_users(user_ids, include_admins)
+        if len(user_ids) > SHARED_INVALIDATION_MAX_USERS:
+            self._share({"all": True})
+        else:
+            self._share({"user_ids": user_ids, "include_admins": include_admins})
+
+    def invalidate_all(self):
+        self._drop_all()
+        self._share({"all": True})
+
+    def apply_shared(self, data: dict):
+        """
+        Applies an invalidation made by another worker.
+        """
+        if data.get("all"):
+            self._drop_all()
+        else:
+            self._drop_users(data["user_ids"], data["include_admins"])
+
+    def _share(self, data: dict):
+        if self.enabled and self.publisher is not None:
+            self.publisher(data)
+
+    def _drop_users(self, user_ids: list[int], include_admins: bool):
+        with self._lock:
+            self._generation += 1
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+            if include_admins:
+                for user_id in [uid for uid, (role, _) in self._users.items() if role == "admin"]:
+                    del self._users[user_id]
+
+    def _drop_all(self):
+        with self._lock:
+            self._generation += 1
+            self._users.clear()
+
+
+calendar_cache = CalendarCache(CALENDAR_CACHE_MAX_USERS, CALENDAR_CACHE_WINDOWS_PER_USER, CALENDAR_CACHE_TTL_SECONDS)
+calendar_cache.publisher = lambda data: realtime_broker.publish_internal(CALENDAR_INVALIDATED, data)
+realtime_broker.on_internal(CALENDAR_INVALIDATED, calendar_cache.apply_shared)
+
+
+async def invalidate_task_viewers(db: AsyncSession, owner_id: int, group_id: Optional[int] = None):
+    """
+    Drops the cached calendars of everyone who can see a task: its owner, the members
+    of its group and all admins.
+    """
+    await invalidate_tasks_viewers(db, [(owner_id, group_id)])
+
+
+
+async def invalidate_tasks_viewers(db: AsyncSession, owners_and_groups: Iterable[tuple[int, Optional[int]]]):
+    """
+    Same as invalidate_task_viewers for many tasks at once, given their (owner_id, group_id)
+    pairs, with a single query for the group members.
+    """
+    user_ids, group_ids = set(), set()
+    for owner_id, group_id in owners_and_groups:
+        user_ids.add(owner_id)
+        if group_id is not None:
+            group_ids.add(group_id)
+    if group_ids:
+        user_ids.update((await db.scalars(
+            select(group_members.c.user_id).where(group_members.c.group_id.in_(group_ids))
+        )).all())
+    calendar_cache.invalidate_users(user_ids)
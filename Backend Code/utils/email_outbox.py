@@ -0,0 +1,222 @@
+# utils/email_outbox.py
+import logging
+import os
+import random
+import smtplib
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+
+from database import SessionLocal
+from models import EmailOutbox
+from utils.email_sender import SMTPConnection, email_configured
+
+logger = logging.getLogger(__name__)
+
+# Set to false to leave queued mail in the outbox without sending it from this process
+EMAIL_OUTBOX_ENABLED = os.getenv("EMAIL_OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes")
+# Messages claimed and sent over one SMTP session per round
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 50))
+# How often (in seconds) the outbox is polled when nobody wakes the dispatcher up
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", 5))
+# Failed sends are retried with exponential backoff (base * 2^(attempt - 1), capped)
+# and dead-lettered after EMAIL_MAX_ATTEMPTS tries
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", 3600))
+# How long claimed messages are reserved for the dispatcher sending them. Must cover a
+# whole batch of SMTP round trips; a message whose outcome was not recorded in time (the
+# process died) is sent again after it.
+EMAIL_SEND_LEASE_SECONDS = float(os.getenv("EMAIL_SEND_LEASE_SECONDS", 600))
+
+# Errors the mail server will answer the same way next time
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def enqueue_email(db, to_email: str, subject: str, body: str) -> EmailOutbox:
+    """
+    Adds a message to the outbox. It is sent once the caller commits; call
+    email_dispatcher.wake() after the commit to send it without waiting for the next poll.
+    """
+    message = EmailOutbox(to_email=to_email, subject=subject, body=body)
+    db.add(message)
+    return message
+
+
+def retry_delay(attempts: int) -> timedelta:
+    delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    # Jitter so messages that failed together are not retried in lockstep
+    return timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, PERMANENT_ERRORS) and error.smtp_code >= 500
+
+
+class EmailDispatcher:
+    """
+    Background thread that drains the outbox in batches over a reused SMTP session.
+
+    Due rows are leased in a short transaction (SELECT ... FOR UPDATE SKIP LOCKED on
+    PostgreSQL) before any mail is sent, so several API processes can each run a
+    dispatcher without sending a message twice, and no transaction stays open across
+    SMTP round trips.
+    """
+
+    def __init__(self, batch_size: int, poll_seconds: float):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="email-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        connection = SMTPConnection()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    processed = self.dispatch_batch(connection)
+                except Exception:
+                    logger.exception("Email dispatcher round failed")
+                    connection.close()
+                    processed = 0
+                # A full batch means there is probably more waiting
+                if processed < self.batch_size:
+                    # Do not hold the SMTP session open while idle
+                    connection.close()
+                    self._wakeup.wait(self.poll_seconds)
+                    self._wakeup.clear()
+        finally:
+            connection.close()
+
+    def claim_batch(self) -> list:
+        """
+        Leases up to batch_size due messages in a short transaction of its own: their
+        next attempt is pushed EMAIL_SEND_LEASE_SECONDS ahead and the attempt counted, so
+        no other dispatcher picks them up while they are being sent, and a dispatcher that
+        dies mid-batch only resends the message it was sending once the lease runs out.
+        """
+        now = datetime.now(timezone.utc)
+        due = (
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        with SessionLocal() as db:
+            # The conditions are checked again by the UPDATE itself, which is what keeps
+            # two dispatchers apart on SQLite (no FOR UPDATE there, but a single writer)
+            messages = db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(due), EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+                .values(attempts=EmailOutbox.attempts + 1, next_attempt_at=now + timedelta(seconds=EMAIL_SEND_LEASE_SECONDS))
+                .returning(EmailOutbox.id, EmailOutbox.to_email, EmailOutbox.subject, EmailOutbox.body, EmailOutbox.attempts)
+            ).all()
+            db.commit()
+        return sorted(messages, key=lambda message: message.id)
+
+    def dispatch_batch(self, connection: SMTPConnection) -> int:
+        """
+        Claims up to batch_size due messages and sends them, recording each outcome in
+        its own transaction. Returns how many were claimed, or 0 when a transient failure
+        cut the batch short, so the dispatcher waits poll_seconds before trying the server
+        again.
+        """
+        messages = self.claim_batch()
+        for position, message in enumerate(messages):
+            try:
+                connection.send(message.to_email, message.subject, message.body)
+            except Exception as error:
+                self._record(message.id, self._failure_values(message, error))
+                if not _is_permanent(error):
+                    # Most likely the server or the network; hand the rest of the batch
+                    # back for the next round instead of failing every message
+                    connection.close()
+                    self._release([unsent.id for unsent in messages[position + 1:]])
+                    return 0
+            else:
+                self._record(message.id, {"status": "sent", "sent_at": datetime.now(timezone.utc), "last_error": None})
+                with self._lock:
+                    self.sent += 1
+        return len(messages)
+
+    def _record(self, message_id: int, values: dict):
+        with SessionLocal() as db:
+            db.execute(update(EmailOutbox).where(EmailOutbox.id == message_id).values(**values))
+            db.commit()
+
+    def _release(self, message_ids: list[int]):
+        # Claimed but not tried: the attempt does not count and they are due again now
+        if not message_ids:
+            return
+        with SessionLocal() as db:
+            db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(message_ids))
+                .values(attempts=EmailOutbox.attempts - 1, next_attempt_at=datetime.now(timezone.utc))
+            )
+            db.commit()
+
+    def _failure_values(self, message, error: Exception) -> dict:
+        last_error = f"{type(error).__name__}: {error}"[:1000]
+        if _is_permanent(error) or message.attempts >= EMAIL_MAX_ATTEMPTS:
+            logger.warning("Dead-lettered email %s to %s after %s attempt(s): %s",
+                           message.id, message.to_email, message.attempts, last_error)
+            with self._lock:
+                self.dead += 1
+            return {"status": "dead", "last_error": last_error}
+        with self._lock:
+            self.retried += 1
+        return {"next_attempt_at": datetime.now(timezone.utc) + retry_delay(message.attempts), "last_error": last_error}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "batch_size": self.batch_size,
+                "poll_seconds": self.poll_seconds,
+                "sent": self.sent,
+                "retried": self.retried,
+                "dead": self.dead,
+            }
+
+
+email_dispatcher = EmailDispatcher(EMAIL_OUTBOX_BATCH_SIZE, EMAIL_OUTBOX_POLL_SECONDS)
+
+
+def start_email_dispatcher():
+    if not EMAIL_OUTBOX_ENABLED:
+        return
+    if not email_configured():
+        logger.warning("Email is not configured; queued messages stay in the outbox until it is.")
+        return
+    email_dispatcher.start()
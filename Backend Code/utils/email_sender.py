@@ -1,4 +1,5 @@
 # utils/email_sender.py
+import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -8,6 +9,8 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 EMAIL_HOST = os.getenv("EMAIL_HOST")
 EMAIL_PORT_RAW = os.getenv("EMAIL_PORT", "587")
 EMAIL_PORT = int(EMAIL_PORT_RAW.split('#')[0].strip())  # This line should now work
@@ -15,49 +18,103 @@ EMAIL_PORT = int(EMAIL_PORT_RAW.split('#')[0].strip())  # This line should now w
 EMAIL_USERNAME = os.getenv("EMAIL_USERNAME")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 EMAIL_SENDER_NAME = os.getenv("EMAIL_SENDER_NAME", "BWC Portal")
+# STARTTLS is on by default; turn it off to point the app at a local test SMTP server
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "true").lower() in ("1", "true", "yes")
+EMAIL_SMTP_TIMEOUT = float(os.getenv("EMAIL_SMTP_TIMEOUT", 30))
 
-# --- NEW: Add debug prints for loaded ENV VARS ---
-print(f"DEBUG_EMAIL_SENDER: Loaded ENV - HOST='{EMAIL_HOST}', PORT={EMAIL_PORT}, USER='{EMAIL_USERNAME}', SENDER_NAME='{EMAIL_SENDER_NAME}'")
-# --- END NEW ---
-
-def send_email(to_email: str, subject: str, body: str):
-    # --- NEW: Debug print for send_email call ---
-    print(f"DEBUG_EMAIL_SENDER: Attempting to send email to '{to_email}' with subject '{subject}'")
-    # --- END NEW ---
+logger.debug("Loaded ENV - HOST='%s', PORT=%s, USER='%s', SENDER_NAME='%s'",
+             EMAIL_HOST, EMAIL_PORT, EMAIL_USERNAME, EMAIL_SENDER_NAME)
 
-    # Check if environment variables are missing (will skip if any are None)
-    if not all([EMAIL_HOST, EMAIL_PORT, EMAIL_USERNAME, EMAIL_PASSWORD]):
-        print("Email sending skipped: Missing one or more email environment variables.")
-        print("Please ensure EMAIL_HOST, EMAIL_PORT, EMAIL_USERNAME, EMAIL_PASSWORD are set in your .env file.")
-        return False
+def email_configured() -> bool:
+    # A local test server (EMAIL_USE_TLS=false) may accept mail without a login
+    return all([EMAIL_HOST, EMAIL_PORT, EMAIL_USERNAME, EMAIL_PASSWORD or not EMAIL_USE_TLS])
 
+def build_message(to_email: str, subject: str, body: str) -> MIMEMultipart:
     message = MIMEMultipart("alternative")
     message["Subject"] = subject
     message["From"] = f"{EMAIL_SENDER_NAME} <{EMAIL_USERNAME}>"
     message["To"] = to_email
 
     # Attach body as plain text
-    part1 = MIMEText(body, "plain")
-    message.attach(part1)
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+
+class SMTPConnection:
+    """
+    A single SMTP session that is opened on first use and reused for every following
+    message, so a batch pays for the TCP handshake, STARTTLS and login only once.
+    A dropped connection is reopened once before the send is reported as failed.
+    """
+
+    def __init__(self):
+        self._server = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._server is not None
+
+    def _open(self):
+        server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=EMAIL_SMTP_TIMEOUT)
+        try:
+            if EMAIL_USE_TLS:
+                server.starttls()
+            if EMAIL_PASSWORD:
+                server.login(EMAIL_USERNAME, EMAIL_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def send(self, to_email: str, subject: str, body: str):
+        """
+        Sends one message, raising the smtplib error on failure.
+        """
+        message = build_message(to_email, subject, body).as_string()
+        if self._server is None:
+            self._open()
+        try:
+            self._server.sendmail(EMAIL_USERNAME, to_email, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server closed an idle session; reconnect and try once more
+            self.close()
+            self._open()
+            self._server.sendmail(EMAIL_USERNAME, to_email, message)
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+
+def send_email(to_email: str, subject: str, body: str):
+    logger.debug("Attempting to send email to '%s' with subject '%s'", to_email, subject)
+
+    # Check if environment variables are missing (will skip if any are None)
+    if not email_configured():
+        logger.warning("Email sending skipped: Missing one or more email environment variables. "
+                       "Please ensure EMAIL_HOST, EMAIL_PORT, EMAIL_USERNAME, EMAIL_PASSWORD are set in your .env file.")
+        return False
 
     try:
-        print("DEBUG_EMAIL_SENDER: Connecting to SMTP server...")  # <--- ADD THIS
-        # Connect to SMTP server (TLS)
-        server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
-        server.starttls()  # Secure the connection
-        print("DEBUG_EMAIL_SENDER: Logging in to SMTP server...")  # <--- ADD THIS
-        server.login(EMAIL_USERNAME, EMAIL_PASSWORD)  # Login to account
-        print("DEBUG_EMAIL_SENDER: Sending email...")  # <--- ADD THIS
-        server.sendmail(EMAIL_USERNAME, to_email, message.as_string())  # Send email
-        server.quit()  # Close connection
-        print(f"DEBUG_EMAIL_SENDER: Email sent successfully to {to_email}")  # <--- UPDATED LOG
+        logger.debug("Connecting to SMTP server...")
+        connection = SMTPConnection()
+        logger.debug("Sending email...")
+        connection.send(to_email, subject, body)
+        connection.close()  # Close connection
+        logger.info("Email sent successfully to %s", to_email)
         return True
     except Exception as e:
-        print(f"DEBUG_EMAIL_SENDER: Failed to send email to {to_email}: {e}")  # <--- UPDATED LOG
+        logger.error("Failed to send email to %s: %s", to_email, e)
         return False
 
 # Example usage (for testing purposes, run this file directly)
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     test_email = "thesrevma@gmail.com"  # Replace with an actual email for testing
     test_subject = "Test Email from BWC Portal"
     test_body = "This is a test email sent from your BWC Portal application."
@@ -0,0 +1,108 @@
+# utils/ics.py
+import hashlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator
+
+PRODUCT_ID = "-//BWC Portal//Calendar Feed//EN"
+# How often subscribed calendar apps are asked to refresh the feed
+ICS_REFRESH_INTERVAL = "PT1H"
+
+
+def escape_text(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n")
+    )
+
+
+def fold_line(line: str) -> str:
+    """
+    Splits a content line into lines of at most 75 octets, as RFC 5545 requires,
+    without cutting a UTF-8 character in half. Continuation lines start with a space.
+    """
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts, current, size = [], [], 0
+    for character in line:
+        length = len(character.encode())
+        # The first line holds 75 octets, the others 74 after their leading space
+        if size + length > (75 if not parts else 74):
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(character)
+        size += length
+    parts.append("".join(current))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _format_start(value) -> tuple[str, str, str]:
+    """
+    Returns the DTSTART and DTEND properties (name with parameters, value) for a
+    calendar event start: whole days for dates, UTC for aware datetimes and floating
+    local time for naive ones.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            text = value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        else:
+            text = value.strftime("%Y%m%dT%H%M%S")
+        return "", text, text
+    return ";VALUE=DATE", value.strftime("%Y%m%d"), (value + timedelta(days=1)).strftime("%Y%m%d")
+
+
+def render_event(event: dict, uid: str, stamp: str) -> str:
+    start = event["start"]
+    if event["allDay"] and isinstance(start, datetime):
+        start = start.date()
+    parameters, dtstart, dtend = _format_start(start)
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART{parameters}:{dtstart}",
+        f"DTEND{parameters}:{dtend}",
+        f"SUMMARY:{escape_text(event['title'])}",
+        f"CATEGORIES:{escape_text(event['type'])}",
+    ]
+    if event.get("details"):
+        lines.append(f"DESCRIPTION:{escape_text(event['details'])}")
+    lines.append("END:VEVENT")
+    return "".join(fold_line(line) for line in lines)
+
+
+def event_uid(event: dict, occurrence: int) -> str:
+    # Calendar events carry no ids, so the UID is derived from what identifies them;
+    # identical events are told apart by their position among themselves
+    key = f"{event['type']}|{event['title']}|{event['start'].isoformat()}|{occurrence}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + "@bwc-portal"
+
+
+def render_calendar(events: Iterable[dict], name: str, chunk_size: int = 200) -> Iterator[bytes]:
+    """
+    Renders CalendarEvent dicts as an iCalendar (RFC 5545) document, yielded in chunks
+    of chunk_size events so the response can be streamed while it is being built.
+    """
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODUCT_ID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(name)}",
+        f"REFRESH-INTERVAL;VALUE=DURATION:{ICS_REFRESH_INTERVAL}",
+        f"X-PUBLISHED-TTL:{ICS_REFRESH_INTERVAL}",
+    ]
+    chunk = ["".join(fold_line(line) for line in header)]
+    seen = Counter()
+    for event in events:
+        identity = (event["type"], event["title"], event["start"])
+        seen[identity] += 1
+        chunk.append(render_event(event, event_uid(event, seen[identity]), stamp))
+        if len(chunk) >= chunk_size:
+            yield "".join(chunk).encode()
+            chunk = []
+    chunk.append("END:VCALENDAR\r\n")
+    yield "".join(chunk).encode()
@@ -0,0 +1,6 @@
+# utils/logging_init.py
+# Importing this module sets up logging. main.py imports it before anything else, so
+# the messages logged while the routers and utilities are imported are kept
+from utils.logging_setup import configure_logging
+
+configure_logging()
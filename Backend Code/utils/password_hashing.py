@@ -0,0 +1,118 @@
+# utils/password_hashing.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+from utils.metrics import Histogram
+
+# bcrypt cost factor for new hashes. Stored hashes with a lower cost are rehashed
+# transparently the next time their owner logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Threads dedicated to bcrypt (the bcrypt library releases the GIL while hashing), so a
+# burst of logins cannot take the worker threads the rest of the API relies on.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Hashing jobs allowed to wait for a free worker. Anything beyond this is refused
+# straight away instead of queueing behind work that will not finish in time.
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", 64))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when the hashing queue is full.
+    """
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a fixed-size thread pool with a bounded backlog.
+    """
+
+    def __init__(self, context: CryptContext, workers: int, queue_limit: int):
+        self.context = context
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.queue_wait = Histogram()
+        self.duration = Histogram()
+
+    def _acquire(self):
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+
+    def _timed(self, submitted_at: float, func, *args):
+        started_at = time.perf_counter()
+        self.queue_wait.observe(started_at - submitted_at)
+        try:
+            return func(*args)
+        finally:
+            self.duration.observe(time.perf_counter() - started_at)
+            # Released by the worker, not the awaiting request: a request cancelled by a
+            # client disconnect leaves its hash running, and it still counts against the limit
+            self._release()
+
+    async def _run(self, func, *args):
+        self._acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._timed, time.perf_counter(), func, *args
+            )
+        except BaseException:
+            self._release()
+            raise
+        return await future
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """
+        Checks a password and, when the stored hash uses outdated settings (e.g. fewer
+        rounds than BCRYPT_ROUNDS), also returns a replacement hash to store.
+        """
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            with self._lock:
+                self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rounds": BCRYPT_ROUNDS,
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "queue_wait_seconds": self.queue_wait.snapshot(),
+                "duration_seconds": self.duration.snapshot(),
+            }
+
+
+password_hasher = PasswordHasher(pwd_context, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT)
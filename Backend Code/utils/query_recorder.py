@@ -0,0 +1,249 @@
+# utils/query_recorder.py
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Development aid: record every request's SQL, log repeated statement shapes (N+1
+# patterns) and endpoints over their query budget, with the code that issued them
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "false").lower() in ("1", "true", "yes")
+# Answer 500 instead of only logging when a request breaks its budget (for test runs)
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() in ("1", "true", "yes")
+# The same statement shape executed this many times in one request is reported
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 5))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Frames in these files are plumbing, never the call site worth reporting
+_PLUMBING_FILES = {os.path.abspath(__file__), os.path.join(BACKEND_DIR, "database.py")}
+
+_IN_LIST = re.compile(r"\bIN \([^()]*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a block or endpoint runs more queries than allowed or repeats a
+    statement shape N_PLUS_ONE_THRESHOLD times.
+    """
+
+
+@dataclass
+class RecordedQuery:
+    statement: str
+    shape: str
+    call_site: str
+    duration: float
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Normalizes a SQL statement so executions that only differ in parameters, or in the
+    length of an expanded IN list, compare equal.
+    """
+    return _IN_LIST.sub("IN (...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+# Call site that handed work to SyncSessionAdapter; queries run by the sync session happen
+# on a threadpool worker whose own stack no longer contains the route handler
+caller_site: ContextVar[Optional[str]] = ContextVar("query_caller_site", default=None)
+
+
+def _app_frame(frame) -> Optional[str]:
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith("<"):
+            filename = os.path.abspath(filename)
+        if filename.startswith(BACKEND_DIR) and filename not in _PLUMBING_FILES:
+            return f"{os.path.relpath(filename, BACKEND_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def find_call_site() -> str:
+    """
+    The innermost application frame that caused the current query. Looks at the current
+    stack, then (async mode) the greenlet the AsyncSession was awaited from, then (sync
+    mode) the frame recorded by SyncSessionAdapter.
+    """
+    call_site = _app_frame(sys._getframe(1))
+    if call_site is None and "greenlet" in sys.modules:
+        parent = sys.modules["greenlet"].getcurrent().parent
+        if parent is not None:
+            call_site = _app_frame(parent.gr_frame)
+    return call_site or caller_site.get() or "unknown"
+
+
+class QueryRecorder:
+    """
+    Collects the statements executed while it is active.
+    """
+
+    def __init__(self):
+        self.queries: list[RecordedQuery] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int, list[str]]]:
+        """
+        Statement shapes executed at least 'threshold' times, with their call sites.
+        """
+        counts = Counter(query.shape for query in self.queries)
+        return [
+            (shape, count, sorted({query.call_site for query in self.queries if query.shape == shape}))
+            for shape, count in counts.most_common()
+            if count >= threshold
+        ]
+
+    def problems(self, budget: Optional[int], threshold: Optional[int] = N_PLUS_ONE_THRESHOLD) -> list[str]:
+        found = []
+        if budget is not None and self.count > budget:
+            found.append(f"{self.count} queries, budget is {budget}")
+        if threshold is None:
+            return found
+        for shape, count, call_sites in self.repeated(threshold):
+            found.append(f"{count}x {shape[:200]} (from {', '.join(call_sites)})")
+        return found
+
+
+current_query_recorder: ContextVar[Optional[QueryRecorder]] = ContextVar("current_query_recorder", default=None)
+# Recorders that see every query regardless of context, used by query_budget() so a test
+# can wrap TestClient calls (the app runs in another thread there)
+_global_recorders: list[QueryRecorder] = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.recorder_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorder = current_query_recorder.get()
+    if recorder is None and not _global_recorders:
+        return
+    query = RecordedQuery(
+        statement=statement,
+        shape=statement_shape(statement),
+        call_site=find_call_site(),
+        duration=time.perf_counter() - context.recorder_started_at,
+    )
+    for target in ([recorder] if recorder is not None else []) + _global_recorders:
+        target.queries.append(query)
+
+
+@contextmanager
+def remembered_call_site():
+    """
+    Used by SyncSessionAdapter around work it sends to the threadpool: notes the calling
+    application frame while its stack is still intact. Does nothing unless recording.
+    """
+    if not (QUERY_DEBUG or _global_recorders):
+        yield
+        return
+    token = caller_site.set(_app_frame(sys._getframe(1)))
+    try:
+        yield
+    finally:
+        caller_site.reset(token)
+
+
+def record_queries_on(engine):
+    """
+    Feeds the statements of an engine (or an AsyncEngine's .sync_engine) to the active recorders.
+    """
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def query_budget(max_queries: Optional[int] = None, n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD):
+    """
+    Fails with QueryBudgetExceeded when the wrapped block runs more than max_queries
+    statements or repeats a statement shape n_plus_one_threshold times, e.g.
+
+        with query_budget(5):
+            client.get("/tasks/", headers=headers)
+    """
+    recorder = QueryRecorder()
+    _global_recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _global_recorders.remove(recorder)
+    problems = recorder.problems(max_queries, n_plus_one_threshold)
+    if problems:
+        raise QueryBudgetExceeded("; ".join(problems))
+
+
+def max_queries(limit: int):
+    """
+    Declares the query budget of an endpoint, checked by QueryRecorderMiddleware.
+    """
+    def decorator(endpoint):
+        endpoint.query_budget = limit
+        return endpoint
+    return decorator
+
+
+def batched_queries(endpoint):
+    """
+    Marks an endpoint whose repeated statements are batches of one large write (e.g. a
+    multi-row INSERT split into pages), so they are not reported as N+1 patterns.
+    """
+    endpoint.n_plus_one_threshold = None
+    return endpoint
+
+
+class QueryRecorderMiddleware:
+    """
+    Records the queries of each HTTP request, reports the total in an X-Query-Count
+    header and logs N+1 patterns and budget overruns with their call sites. With
+    QUERY_BUDGET_STRICT the offending request fails instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recorder = QueryRecorder()
+        token = current_query_recorder.set(recorder)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                self.check(scope, recorder)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-query-count", str(recorder.count).encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_recorder.reset(token)
+
+    def check(self, scope, recorder: QueryRecorder):
+        endpoint = scope.get("endpoint")
+        budget = getattr(endpoint, "query_budget", None)
+        problems = recorder.problems(budget, getattr(endpoint, "n_plus_one_threshold", N_PLUS_ONE_THRESHOLD))
+        if not problems:
+            return
+        report = f"{scope['method']} {scope['path']}: " + "; ".join(problems)
+        if QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(report)
+        logger.warning("Query check failed for %s", report)
@@ -0,0 +1,253 @@
+# utils/realtime.py
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from dataclasses import replace
+from typing import Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from database import engine
+from utils.principal_cache import Principal
+
+logger = logging.getLogger(__name__)
+
+# How change notifications reach the connected clients:
+#   "memory"   - delivered inside this process only (fine for a single worker)
+#   "postgres" - sent through PostgreSQL LISTEN/NOTIFY so every worker sees every change
+REALTIME_BACKEND = os.getenv("REALTIME_BACKEND", "memory").lower()
+REALTIME_CHANNEL = os.getenv("REALTIME_CHANNEL", "bwc_realtime")
+# Undelivered messages kept per connection; a client that falls further behind is told to resync
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", 100))
+
+# Tells the notifications this process sent apart from those of other workers
+PROCESS_ID = uuid.uuid4().hex
+
+
+def task_audience(owner_id: int, group_id: Optional[int]) -> dict:
+    # Same visibility as GET /tasks/: admins, the owner and the members of the task's group
+    return {"admins": True, "user_ids": [owner_id], "group_id": group_id}
+
+
+def group_audience(group_id: int, user_ids: list[int]) -> dict:
+    # Membership changes: admins, the current members and the users who joined or left
+    return {"admins": True, "user_ids": list(user_ids), "group_id": group_id}
+
+
+def everyone() -> dict:
+    return {"all": True}
+
+
+def reaches(principal: Principal, audience: dict) -> bool:
+    if audience.get("all"):
+        return True
+    if audience.get("admins") and principal.role == "admin":
+        return True
+    if principal.id in audience.get("user_ids", ()):
+        return True
+    group_id = audience.get("group_id")
+    return group_id is not None and group_id in principal.group_ids
+
+
+class Subscription:
+    """
+    One connected client: the Principal used for filtering and a bounded queue of
+    messages waiting to be written to its stream.
+    """
+
+    def __init__(self, principal: Principal, queue_size: int):
+        self.principal = principal
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # Set when messages had to be dropped; the client must refetch everything
+        self.overflowed = False
+
+    def offer(self, message: dict):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def track_membership(self, message: dict):
+        # Keep the cached group ids in step so later task messages are filtered correctly
+        data = message["data"]
+        if data.get("user_id") == self.principal.id or self.principal.id in data.get("user_ids", ()):
+            group_ids = set(self.principal.group_ids)
+            if message["type"] == "group.member_added":
+                group_ids.add(data["group_id"])
+            else:
+                group_ids.discard(data["group_id"])
+            self.principal = replace(self.principal, group_ids=frozenset(group_ids))
+
+
+class InProcessBroker:
+    """
+    Delivers published messages to the subscriptions of this process.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscriptions: set[Subscription] = set()
+        self._internal_handlers: dict[str, Callable[[dict], None]] = {}
+        self.published = 0
+        self.delivered = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, principal: Principal) -> Subscription:
+        subscription = Subscription(principal, self.queue_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def on_internal(self, event_type: str, handler: Callable[[dict], None]):
+        """
+        Registers the handler of a message that processes send each other (e.g. a cache
+        invalidation). Internal messages are never delivered to clients.
+        """
+        self._internal_handlers[event_type] = handler
+
+    def publish_internal(self, event_type: str, data: dict):
+        """
+        Sends an internal message to the other processes without waiting for it. This
+        process has already applied the change itself, and there are no others here.
+        """
+
+    async def publish(self, event_type: str, audience: dict, **data):
+        await self.publish_all([(event_type, audience, data)])
+
+    async def publish_all(self, messages: list[tuple[str, dict, dict]]):
+        """
+        Publishes several (event_type, audience, data) messages, e.g. for a bulk change.
+        """
+        self.published += len(messages)
+        for event_type, audience, data in messages:
+            self._dispatch({"type": event_type, "audience": audience, "data": data})
+
+    def _dispatch(self, message: dict):
+        if message.get("internal"):
+            handler = self._internal_handlers.get(message["type"])
+            if handler is not None and message.get("origin") != PROCESS_ID:
+                handler(message["data"])
+            return
+        membership_change = message["type"] in ("group.member_added", "group.member_removed", "group.deleted")
+        for subscription in list(self._subscriptions):
+            if reaches(subscription.principal, message["audience"]):
+                subscription.offer({"type": message["type"], "data": message["data"]})
+                self.delivered += 1
+            if membership_change:
+                subscription.track_membership(message)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Fans messages out to every API process with NOTIFY on a shared channel. Each process
+    keeps one dedicated connection that LISTENs and hands incoming notifications to its
+    own subscriptions. Payloads only carry ids, well under the 8000 byte NOTIFY limit.
+    """
+
+    def __init__(self, queue_size: int, engine, channel: str):
+        super().__init__(queue_size)
+        self.engine = engine
+        self.channel = channel
+        self._loop = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="realtime-listener", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            await run_in_threadpool(self._thread.join, 5)
+            self._thread = None
+
+    async def publish_all(self, messages: list[tuple[str, dict, dict]]):
+        self.published += len(messages)
+        payloads = [
+            json.dumps({"type": event_type, "audience": audience, "data": data}, default=str)
+            for event_type, audience, data in messages
+        ]
+        await run_in_threadpool(self._notify, payloads)
+
+    def publish_internal(self, event_type: str, data: dict):
+        payload = json.dumps({"type": event_type, "internal": True, "origin": PROCESS_ID, "data": data}, default=str)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._notify([payload])
+            return
+        future = loop.run_in_executor(None, self._notify, [payload])
+        future.add_done_callback(self._log_failed_notify)
+
+    @staticmethod
+    def _log_failed_notify(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Could not send an internal realtime message", exc_info=future.exception())
+
+    def _notify(self, payloads: list[str]):
+        # One connection and transaction for the whole batch
+        with self.engine.connect() as connection:
+            for payload in payloads:
+                connection.exec_driver_sql("SELECT pg_notify(%s, %s)", (self.channel, payload))
+            connection.commit()
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("Realtime listener lost its connection, reconnecting")
+                self._stopping.wait(1)
+
+    def _listen_once(self):
+        # A connection of its own, taken out of the pool for as long as it listens
+        connection = self.engine.raw_connection()
+        connection.detach()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            while not self._stopping.is_set():
+                if select.select([dbapi_connection], [], [], 1.0) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    self._loop.call_soon_threadsafe(self._dispatch, json.loads(notification.payload))
+        finally:
+            connection.close()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "postgres", "listening": self._thread is not None and self._thread.is_alive()}
+
+
+def create_broker():
+    if REALTIME_BACKEND == "postgres":
+        return PostgresBroker(REALTIME_QUEUE_SIZE, engine, REALTIME_CHANNEL)
+    return InProcessBroker(REALTIME_QUEUE_SIZE)
+
+
+realtime_broker = create_broker()
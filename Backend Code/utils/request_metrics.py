@@ -0,0 +1,115 @@
+# utils/request_metrics.py
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from utils.metrics import Counter, Gauge, HistogramFamily, registry
+
+# Turns on the metrics middleware, the query counters and the Prometheus endpoint
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP requests by method, route and status code.", ("method", "route", "status")
+))
+http_request_duration_seconds = registry.register(HistogramFamily(
+    "http_request_duration_seconds", "HTTP request latency by method and route.", ("method", "route")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served."
+))
+db_queries_per_request = registry.register(HistogramFamily(
+    "db_queries_per_request", "SQL statements executed per HTTP request.", ("method", "route"), QUERY_COUNT_BUCKETS
+))
+db_time_per_request_seconds = registry.register(HistogramFamily(
+    "db_time_per_request_seconds", "Time spent executing SQL per HTTP request.", ("method", "route")
+))
+db_queries_total = registry.register(Counter(
+    "db_queries_total", "SQL statements executed, inside or outside requests."
+))
+
+
+class RequestStats:
+    """
+    Database work done on behalf of the current request.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set by the middleware for the duration of a request. Starlette copies the context into
+# threadpool workers, so queries run by the sync session are attributed correctly too.
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db_queries_total.labels().inc()
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - context.metrics_started_at
+
+
+def instrument_engine(engine):
+    """
+    Counts statements and their execution time. Pass the sync engine, or an AsyncEngine's
+    .sync_engine (its events fire in the same context as the awaiting coroutine).
+    """
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status codes, in-flight requests and the database
+    work of every HTTP request. Routes are labelled by their path template (e.g.
+    /tasks/{task_id}) so ids do not blow up the number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        in_flight = http_requests_in_flight.labels()
+        in_flight.inc()
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            current_request_stats.reset(token)
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests_total.labels(method, route_label, status_code).inc()
+            http_request_duration_seconds.labels(method, route_label).observe(elapsed)
+            db_queries_per_request.labels(method, route_label).observe(stats.queries)
+            db_time_per_request_seconds.labels(method, route_label).observe(stats.db_seconds)
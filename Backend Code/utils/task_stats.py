@@ -0,0 +1,154 @@
+# utils/task_stats.py
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy import Date, case, delete, func, insert, literal, or_, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import NO_DUE_DATE, PAST_DUE_DATE, Task, TaskStat
+
+# Scopes a task is counted in, and the task column holding the scope's id
+SCOPE_COLUMNS = {"all": literal(0), "user": Task.owner_id, "group": Task.group_id, "company": Task.company_id}
+# Eisenhower quadrants by (urgency, important)
+QUADRANTS = {
+    (True, True): "urgent_important",
+    (False, True): "not_urgent_important",
+    (True, False): "urgent_not_important",
+    (False, False): "not_urgent_not_important",
+}
+# "Due this week" covers today and the next DUE_SOON_DAYS - 1 days
+DUE_SOON_DAYS = 7
+
+
+def task_stat_keys(task) -> list[tuple]:
+    """
+    The task_stats rows a task is counted in, as (scope, scope_id, status, urgency,
+    important, due_date) keys. Take them before and after changing a task and pass both
+    to update_task_stats.
+    """
+    task_status = task.status or "new"
+    if task.deadline is None or task_status == "completed":
+        due_date = NO_DUE_DATE
+    elif task.deadline.date() < date.today():
+        due_date = PAST_DUE_DATE
+    else:
+        due_date = task.deadline.date()
+    counted = (task_status, bool(task.urgency), bool(task.important), due_date)
+    return [
+        (scope, scope_id, *counted)
+        for scope, scope_id in (("all", 0), ("user", task.owner_id), ("group", task.group_id), ("company", task.company_id))
+        if scope_id is not None
+    ]
+
+
+def _upsert(dialect_name: str):
+    module = postgresql if dialect_name == "postgresql" else sqlite
+    return module.insert(TaskStat)
+
+
+async def update_task_stats(db, removed: list[tuple], added: list[tuple]):
+    """
+    Moves tasks between task_stats rows with a single INSERT ... ON CONFLICT statement,
+    in the caller's transaction. Rows are written in key order so concurrent requests
+    lock them in the same order.
+    """
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    rows = [
+        dict(zip(("scope", "scope_id", "status", "urgency", "important", "due_date", "task_count"), (*key, delta)))
+        for key, delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+    statement = _upsert(db.bind.dialect.name).values(rows)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=list(TaskStat.__table__.primary_key.columns),
+        set_={"task_count": TaskStat.task_count + statement.excluded.task_count},
+    ))
+
+
+async def forget_task_stats(db, scope: str, scope_id: int):
+    """
+    Drops the counts of a deleted group or company, whose tasks are no longer linked to it.
+    """
+    await db.execute(delete(TaskStat).where(TaskStat.scope == scope, TaskStat.scope_id == scope_id))
+
+
+async def summarize_task_stats(db, scope: str, scope_ids, today: date) -> dict:
+    """
+    Sums the task_stats rows of a scope into one summary per scope id, or of every
+    scope id when scope_ids is None.
+    """
+    due_soon = TaskStat.due_date.between(today, today + timedelta(days=DUE_SOON_DAYS - 1))
+    query = (
+        select(
+            TaskStat.scope_id, TaskStat.status, TaskStat.urgency, TaskStat.important,
+            func.sum(TaskStat.task_count),
+            func.sum(case((TaskStat.due_date < today, TaskStat.task_count), else_=0)),
+            func.sum(case((due_soon, TaskStat.task_count), else_=0)),
+        )
+        .where(TaskStat.scope == scope)
+        .group_by(TaskStat.scope_id, TaskStat.status, TaskStat.urgency, TaskStat.important)
+    )
+    if scope_ids is not None:
+        query = query.where(TaskStat.scope_id.in_(scope_ids))
+
+    summaries = {}
+    for row_scope_id, task_status, urgency, important, total, overdue, due_this_week in (await db.execute(query)).all():
+        if not total:
+            continue
+        summary = summaries.setdefault(row_scope_id, empty_summary(scope, row_scope_id))
+        summary["total"] += total
+        summary["by_status"][task_status] = summary["by_status"].get(task_status, 0) + total
+        summary["by_quadrant"][QUADRANTS[bool(urgency), bool(important)]] += total
+        summary["overdue"] += overdue
+        summary["due_this_week"] += due_this_week
+    return summaries
+
+
+def empty_summary(scope: str, scope_id) -> dict:
+    return {
+        "scope": scope, "scope_id": None if scope == "all" else scope_id, "total": 0, "by_status": {},
+        "by_quadrant": dict.fromkeys(QUADRANTS.values(), 0), "overdue": 0, "due_this_week": 0,
+    }
+
+
+def rebuild_task_stats(connection) -> int:
+    """
+    Recomputes task_stats from the tasks table in the connection's transaction and
+    returns the number of rows written. On PostgreSQL the table is locked first, so task
+    changes committed meanwhile wait and apply their deltas on top of the new counts.
+    Rebuilding also drops the rows that fell to zero and folds the days that have passed
+    since the last rebuild into PAST_DUE_DATE, so running it nightly keeps the table small.
+    """
+    today = date.today()
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("LOCK TABLE task_stats IN EXCLUSIVE MODE"))
+    connection.execute(delete(TaskStat))
+
+    task_status = func.coalesce(Task.status, "new")
+    urgency = func.coalesce(Task.urgency, False)
+    important = func.coalesce(Task.important, False)
+    # date() is a function on SQLite and a cast on PostgreSQL
+    deadline_date = func.date(Task.deadline, type_=Date)
+    due_date = case(
+        (or_(Task.deadline.is_(None), task_status == "completed"), literal(NO_DUE_DATE, Date)),
+        (deadline_date < today, literal(PAST_DUE_DATE, Date)),
+        else_=deadline_date,
+    )
+    written = 0
+    for scope, column in SCOPE_COLUMNS.items():
+        # Grouped by the subquery's columns, since PostgreSQL does not match expressions
+        # that hold bound parameters between SELECT and GROUP BY
+        keys = select(
+            column.label("scope_id"), task_status.label("status"), urgency.label("urgency"),
+            important.label("important"), due_date.label("due_date"),
+        ).where(column.isnot(None)).subquery()
+        counted = (keys.c.scope_id, keys.c.status, keys.c.urgency, keys.c.important, keys.c.due_date)
+        result = connection.execute(insert(TaskStat).from_select(
+            ["scope", "scope_id", "status", "urgency", "important", "due_date", "task_count"],
+            select(literal(scope), *counted, func.count()).group_by(*counted),
+        ))
+        written += result.rowcount
+    return written
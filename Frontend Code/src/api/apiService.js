@@ -2,16 +2,22 @@
 
 const BASE_URL = "http://127.0.0.1:8000";
 
+// Page size used when walking keyset-paginated list endpoints
+const PAGE_SIZE = 500;
+// Delay before reopening a dropped realtime stream, doubled after each failure
+const REALTIME_RETRY_MIN_MS = 1000;
+const REALTIME_RETRY_MAX_MS = 60000;
+
 /**
- * Generic function to make API calls to the backend.
+ * Sends a request to the backend and returns the parsed body together with the response headers.
  * @param {string} endpoint The API endpoint (e.g., "/token", "/users/me", "/tasks/").
  * @param {string} method The HTTP method (GET, POST, PUT, DELETE).
  * @param {object | URLSearchParams | null} data The request body data for POST/PUT, or null for GET/DELETE.
  * @param {string | null} token The authentication token, if required.
- * @returns {Promise<any>} The parsed JSON response or null for 204 No Content.
+ * @returns {Promise<{data: any, headers: Headers}>} The parsed JSON response (null for 204 No Content) and the headers.
  * @throws {Error} If the API response is not OK.
  */
-async function callApi(endpoint, method = 'GET', data = null, token = null) {
+async function sendRequest(endpoint, method = 'GET', data = null, token = null) {
     const headers = {};
     const config = {
         method,
@@ -50,10 +56,43 @@ async function callApi(endpoint, method = 'GET', data = null, token = null) {
     }
 
     if (response.status === 204) {
-        return null;
+        return { data: null, headers: response.headers };
     }
 
-    return response.json();
+    return { data: await response.json(), headers: response.headers };
+}
+
+/**
+ * Generic function to make API calls to the backend.
+ * @param {string} endpoint The API endpoint (e.g., "/token", "/users/me", "/tasks/").
+ * @param {string} method The HTTP method (GET, POST, PUT, DELETE).
+ * @param {object | URLSearchParams | null} data The request body data for POST/PUT, or null for GET/DELETE.
+ * @param {string | null} token The authentication token, if required.
+ * @returns {Promise<any>} The parsed JSON response or null for 204 No Content.
+ * @throws {Error} If the API response is not OK.
+ */
+async function callApi(endpoint, method = 'GET', data = null, token = null) {
+    const { data: body } = await sendRequest(endpoint, method, data, token);
+    return body;
+}
+
+/**
+ * Fetches every page of a paginated list endpoint by following the X-Next-Cursor header.
+ * @param {string} endpoint The list endpoint, optionally with its own query string.
+ * @param {string | null} token The authentication token, if required.
+ * @returns {Promise<Array>} All items of the list.
+ */
+async function callApiAllPages(endpoint, token = null) {
+    const separator = endpoint.includes('?') ? '&' : '?';
+    const items = [];
+    let cursor = null;
+    do {
+        const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+        const { data, headers } = await sendRequest(`${endpoint}${separator}limit=${PAGE_SIZE}${cursorParam}`, 'GET', null, token);
+        items.push(...data);
+        cursor = headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
 }
 
 // --- Authentication API calls ---
@@ -91,7 +130,7 @@ export const authApi = {
      */
     listAllUsers: (token, search = '') => {
         const queryString = search ? `?search=${encodeURIComponent(search)}` : '';
-        return callApi(`/users/all${queryString}`, 'GET', null, token);
+        return callApiAllPages(`/users/all${queryString}`, token);
     },
 
     /**
@@ -144,7 +183,31 @@ export const taskApi = {
      * Retrieves all tasks for the current authenticated user.
      * @param {string} token - The access token.
      */
-    getTasks: (token) => callApi('/tasks/', 'GET', null, token),
+    getTasks: (token) => callApiAllPages('/tasks/', token),
+
+    /**
+     * Retrieves the tasks created, updated or deleted since a previous sync, following
+     * every page. Deletions and next_since come with the first page.
+     * @param {string | null} since - The next_since value of the previous call, or null for a full sync.
+     * @param {string} token - The access token.
+     * @returns {Promise<{tasks: Array, deleted: Array<number>, next_since: string}>}
+     */
+    getTaskChanges: async (since, token) => {
+        const sinceParam = since ? `&since=${encodeURIComponent(since)}` : '';
+        let changes = null;
+        let cursor = null;
+        do {
+            const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+            const { data, headers } = await sendRequest(`/tasks/changes?limit=${PAGE_SIZE}${sinceParam}${cursorParam}`, 'GET', null, token);
+            if (changes) {
+                changes.tasks.push(...data.tasks);
+            } else {
+                changes = data;
+            }
+            cursor = headers.get('X-Next-Cursor');
+        } while (cursor);
+        return changes;
+    },
 
     /**
      * Retrieves a specific task by its ID.
@@ -167,6 +230,30 @@ export const taskApi = {
      * @param {string} token - The access token.
      */
     deleteTask: (taskId, token) => callApi(`/tasks/${taskId}`, 'DELETE', null, token),
+
+    /**
+     * Creates many tasks in one request (admin only).
+     * @param {Array<object>} items - Task data, each optionally with a group_id.
+     * @param {string} token - The access token.
+     * @returns {Promise<{results: Array}>} One result per item, in request order.
+     */
+    createTasksBulk: (items, token) => callApi('/tasks/bulk', 'POST', { items }, token),
+
+    /**
+     * Updates many tasks in one request.
+     * @param {Array<object>} items - The fields to update, each with the task id.
+     * @param {string} token - The access token.
+     * @returns {Promise<{results: Array}>} One result per item, in request order.
+     */
+    updateTasksBulk: (items, token) => callApi('/tasks/bulk', 'PUT', { items }, token),
+
+    /**
+     * Deletes many tasks in one request.
+     * @param {Array<number>} ids - The IDs of the tasks to delete.
+     * @param {string} token - The access token.
+     * @returns {Promise<{results: Array}>} One result per id, in request order.
+     */
+    deleteTasksBulk: (ids, token) => callApi('/tasks/bulk-delete', 'POST', { ids }, token),
 };
 
 // --- Group Management API calls ---
@@ -212,7 +299,7 @@ export const groupApi = {
      * @param {number} groupId - The ID of the group.
      * @param {string} token - The access token.
      */
-    getGroupTasks: (groupId, token) => callApi(`/groups/${groupId}/tasks`, 'GET', null, token),
+    getGroupTasks: (groupId, token) => callApiAllPages(`/groups/${groupId}/tasks`, token),
 
     /**
      * Deletes a group.
@@ -243,12 +330,12 @@ export const calendarApi = {
      * Retrieves calendar events (birthdays, task deadlines) for the current user.
      * Role-based: admin sees all, regular user sees own/group-assigned.
      * @param {string} token - The access token.
-     * @param {object} params - Optional date filters { start_date: 'YYYY-MM-DD', end_date: 'YYYY-MM-DD' }.
+     * @param {object} params - Optional visible window { start: 'YYYY-MM-DD', end: 'YYYY-MM-DD' }.
      */
     getCalendarEvents: (token, params = {}) => {
         const queryString = new URLSearchParams();
-        if (params.start_date) queryString.append('start_date', params.start_date);
-        if (params.end_date) queryString.append('end_date', params.end_date);
+        if (params.start) queryString.append('start', params.start);
+        if (params.end) queryString.append('end', params.end);
         const query = queryString.toString() ? `?${queryString.toString()}` : '';
         return callApi(`/calendar/events${query}`, 'GET', null, token);
     },
@@ -267,7 +354,7 @@ export const companyApi = {
      * Retrieves all companies for the current authenticated user.
      * @param {string} token - The access token.
      */
-    getAll: (token) => callApi('/companies/', 'GET', null, token),
+    getAll: (token) => callApiAllPages('/companies/', token),
 
     /**
      * Retrieves a specific company by its ID.
@@ -318,7 +405,7 @@ export const eventApi = {
      * --- NEW: Retrieves a list of all events. ---
      * @param {string} token - The access token.
      */
-    getAllEvents: (token) => callApi('/events/', 'GET', null, token),
+    getAllEvents: (token) => callApiAllPages('/events/', token),
 
     /**
      * --- NEW: Deletes an event by its ID. Admin only. ---
@@ -327,3 +414,61 @@ export const eventApi = {
      */
     deleteEvent: (eventId, token) => callApi(`/events/${eventId}`, 'DELETE', null, token),
 };
+
+// --- Real-time change notifications ---
+export const realtimeApi = {
+    /**
+     * Opens the Server-Sent Events stream of changes visible to the current user.
+     * Messages only carry ids (e.g. { task_id }); refetch the data you need.
+     * EventSource cannot send headers, so each connection uses a short-lived ticket in
+     * the URL instead of the access token, and reconnects with a new one when it drops.
+     * @param {string} token - The access token.
+     * @param {object} handlers - Callbacks keyed by event type, e.g. { 'task.updated': (data) => ..., resync: () => ... }.
+     * @returns {function} Closes the stream.
+     */
+    subscribe: (token, handlers) => {
+        let source = null;
+        let stopped = false;
+        let retryDelay = REALTIME_RETRY_MIN_MS;
+
+        const reconnectLater = () => {
+            if (stopped) return;
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, REALTIME_RETRY_MAX_MS);
+        };
+
+        const connect = async () => {
+            if (stopped) return;
+            let ticket;
+            try {
+                ({ ticket } = await callApi('/realtime/ticket', 'POST', null, token));
+            } catch (err) {
+                reconnectLater();
+                return;
+            }
+            if (stopped) return;
+            source = new EventSource(`${BASE_URL}/realtime/stream?ticket=${encodeURIComponent(ticket)}`);
+            source.onopen = () => { retryDelay = REALTIME_RETRY_MIN_MS; };
+            Object.entries(handlers).forEach(([eventType, handler]) => {
+                source.addEventListener(eventType, (message) => handler(JSON.parse(message.data)));
+            });
+            // The session expired or the account was disabled: stay disconnected
+            source.addEventListener('closed', () => {
+                stopped = true;
+                source.close();
+            });
+            // The ticket in the URL is only valid briefly, so reconnect with a new one
+            // instead of letting EventSource retry the same URL
+            source.onerror = () => {
+                source.close();
+                reconnectLater();
+            };
+        };
+
+        connect();
+        return () => {
+            stopped = true;
+            if (source) source.close();
+        };
+    },
+};
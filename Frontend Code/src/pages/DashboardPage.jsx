@@ -12,6 +12,10 @@ import getDay from 'date-fns/getDay';
 import enUS from 'date-fns/locale/en-US';
 import addMonths from 'date-fns/addMonths';
 import subMonths from 'date-fns/subMonths';
+import addDays from 'date-fns/addDays';
+import startOfMonth from 'date-fns/startOfMonth';
+import endOfMonth from 'date-fns/endOfMonth';
+import endOfWeek from 'date-fns/endOfWeek';
 import 'react-big-calendar/lib/css/react-big-calendar.css';
 
 import EventModal from '../components/EventModal';
@@ -21,6 +25,38 @@ import './DashboardTasks.css';
 const locales = { 'en-US': enUS };
 const localizer = dateFnsLocalizer({ format, parse, startOfWeek, getDay, locales });
 
+// Days shown by the Agenda view (react-big-calendar's default length)
+const AGENDA_LENGTH_DAYS = 30;
+
+// First and last day the calendar shows for a view, as the 'YYYY-MM-DD' strings the
+// /calendar/events endpoint expects. The month grid includes the days of the
+// neighbouring months that fill its first and last week.
+const visibleRange = (view, date) => {
+    let start, end;
+    switch (view) {
+        case 'week':
+            [start, end] = [startOfWeek(date), endOfWeek(date)];
+            break;
+        case 'day':
+            [start, end] = [date, date];
+            break;
+        case 'agenda':
+            [start, end] = [date, addDays(date, AGENDA_LENGTH_DAYS)];
+            break;
+        default:
+            [start, end] = [startOfWeek(startOfMonth(date)), endOfWeek(endOfMonth(date))];
+    }
+    return { start: format(start, 'yyyy-MM-dd'), end: format(end, 'yyyy-MM-dd') };
+};
+
+const toCalendarEvents = (calEvents) => calEvents.map(ev => ({
+    title: ev.title,
+    start: new Date(ev.start),
+    end: new Date(ev.end),
+    allDay: ev.allDay,
+    resource: ev
+}));
+
 function DashboardPage() {
     const { currentUser, accessToken, loading: authLoading } = useAuth();
     const { showNotification } = useNotification();
@@ -37,25 +73,16 @@ function DashboardPage() {
     const [currentDate, setCurrentDate] = useState(new Date());
 
     const isAdmin = currentUser?.role === "admin";
+    const { start: rangeStart, end: rangeEnd } = visibleRange(currentView, currentDate);
 
     const fetchDashboardData = useCallback(async () => {
         if (!accessToken) return;
         setLoadingContent(true);
         try {
-            const [calEvents, tasks, event] = await Promise.all([
-                calendarApi.getCalendarEvents(accessToken),
+            const [tasks, event] = await Promise.all([
                 taskApi.getTasks(accessToken),
                 !isAdmin ? eventApi.getUpcomingEvent(accessToken) : Promise.resolve(null)
             ]);
-
-            const formattedEvents = calEvents.map(ev => ({
-                title: ev.title,
-                start: new Date(ev.start),
-                end: new Date(ev.end),
-                allDay: ev.allDay,
-                resource: ev
-            }));
-            setCalendarEvents(formattedEvents);
             setAllMyTasks(tasks);
 
             if (event) {
@@ -74,6 +101,21 @@ function DashboardPage() {
             fetchDashboardData();
         }
     }, [authLoading, accessToken, fetchDashboardData]);
+
+    // The calendar only receives the visible window, so it is fetched again whenever the
+    // view or the date moves it. Responses arriving after a newer navigation are ignored.
+    useEffect(() => {
+        if (authLoading || !accessToken) return;
+        let ignore = false;
+        calendarApi.getCalendarEvents(accessToken, { start: rangeStart, end: rangeEnd })
+            .then(calEvents => {
+                if (!ignore) setCalendarEvents(toCalendarEvents(calEvents));
+            })
+            .catch(err => {
+                if (!ignore) showNotification(err.message || 'Failed to load calendar events.', 'error');
+            });
+        return () => { ignore = true; };
+    }, [authLoading, accessToken, rangeStart, rangeEnd, showNotification]);
     
     // --- RESTORED: Handlers for calendar navigation ---
     const handleNavigate = useCallback((newDate) => {
@@ -1,7 +1,7 @@
 // src/pages/TasksPage.jsx
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
-import { taskApi } from '../api/apiService';
+import { taskApi, realtimeApi } from '../api/apiService';
 import { useNotification } from '../context/NotificationContext';
 import TaskForm from '../components/TaskForm';
 import './Tasks.css';
@@ -14,14 +14,18 @@ function TasksPage() {
     const [loading, setLoading] = useState(true);
     const [showCreateForm, setShowCreateForm] = useState(false);
 
+    // High-water mark of the last sync; later refreshes only fetch what changed since
+    const syncedSince = useRef(null);
+
     const isAdmin = currentUser?.role === "admin";
 
     const fetchTasks = useCallback(async () => {
         if (!accessToken) return;
         setLoading(true);
         try {
-            const fetchedTasks = await taskApi.getTasks(accessToken);
-            setTasks(fetchedTasks);
+            const changes = await taskApi.getTaskChanges(null, accessToken);
+            syncedSince.current = changes.next_since;
+            setTasks(changes.tasks);
         } catch (err) {
             showNotification(err.message || 'Failed to fetch tasks.', 'error');
         } finally {
@@ -29,17 +33,49 @@ function TasksPage() {
         }
     }, [accessToken, showNotification]);
 
+    // Applies the changes since the last sync instead of reloading the whole list
+    const refreshTasks = useCallback(async () => {
+        if (!syncedSince.current) return fetchTasks();
+        try {
+            const changes = await taskApi.getTaskChanges(syncedSince.current, accessToken);
+            syncedSince.current = changes.next_since;
+            setTasks(previous => {
+                const byId = new Map(previous.map(task => [task.id, task]));
+                changes.tasks.forEach(task => byId.set(task.id, task));
+                changes.deleted.forEach(taskId => byId.delete(taskId));
+                return Array.from(byId.values()).sort((a, b) => a.id - b.id);
+            });
+        } catch (err) {
+            // The sync point expired (or the request failed): start over
+            fetchTasks();
+        }
+    }, [accessToken, fetchTasks]);
+
     useEffect(() => {
         if (!authLoading && accessToken) {
             fetchTasks();
         }
     }, [accessToken, authLoading, fetchTasks]);
 
+    // Pick up changes made by other users as they happen
+    useEffect(() => {
+        if (authLoading || !accessToken) return undefined;
+        return realtimeApi.subscribe(accessToken, {
+            'task.created': refreshTasks,
+            'task.updated': refreshTasks,
+            'task.deleted': refreshTasks,
+            'group.member_added': refreshTasks,
+            'group.member_removed': fetchTasks,
+            'group.deleted': fetchTasks,
+            resync: fetchTasks,
+        });
+    }, [accessToken, authLoading, refreshTasks, fetchTasks]);
+
     const handleCreateTask = async (taskData) => {
         try {
             await taskApi.createTask(taskData, accessToken);
             showNotification('Task created successfully!', 'success');
-            fetchTasks();
+            refreshTasks();
             setShowCreateForm(false);
         } catch (err) {
             showNotification(err.message || 'Failed to create task.', 'error');
@@ -50,7 +86,7 @@ function TasksPage() {
         try {
             await taskApi.updateTask(taskId, { completed: !currentCompletedStatus }, accessToken);
             showNotification(`Task marked as ${!currentCompletedStatus ? 'completed' : 'incomplete'}!`, 'success');
-            fetchTasks();
+            refreshTasks();
         } catch (err) {
             showNotification(err.message || 'Failed to update task status.', 'error');
         }
@@ -61,7 +97,7 @@ function TasksPage() {
         try {
             await taskApi.deleteTask(taskId, accessToken);
             showNotification('Task deleted successfully!', 'success');
-            fetchTasks();
+            refreshTasks();
         } catch (err) {
             showNotification(err.message || 'Failed to delete task.', 'error');
         }